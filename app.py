@@ -1,10 +1,27 @@
-import re
 import io
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime, date, timedelta
-from docx import Document
+from datetime import datetime
+
+from panorama_core import (
+    CASES_FIELDS, STAGES_FIELDS,
+    as_date, fmt_date, safe_progress_value, df_to_csv_bytes, read_header, read_table_streaming,
+    extract_stage_label_and_days, enrich_static, at_reference_date, completion_summary, active_by_area, stage_day_stats,
+    case_metrics, stage_durations, build_case_index, build_stage_index,
+    build_sol_index, sol_due_within, sol_overrun, sol_table,
+    stage_intervals, measured_stage_stats, stage_transitions, transition_matrix,
+    history_as_of, backlog_series, incremental_refresh, save_snapshot, INCREMENTAL_SUMMARIES, merge_cases, merge_history,
+    suggest_mapping, normalize_mapped, memory_report,
+)
+from panorama_reports import build_payloads, write_reports_zip
+from panorama_charts import barh_png
+from panorama_profiling import profile_section, profiled, profile_frame, profile_summary, profile_json
 
 # =========================
 # CONFIG & TEMA
@@ -48,64 +65,99 @@ st.markdown(
 # =========================
 # HELPERS
 # =========================
-def parse_date(val, fallback=None):
-    """Converte para date com dayfirst=True (dd/mm/aaaa)."""
-    if pd.isna(val) or val is None or str(val).strip() == "":
-        return fallback
-    try:
-        d = pd.to_datetime(val, errors="coerce", dayfirst=True)
-        if pd.isna(d):
-            return fallback
-        return d.date()
-    except Exception:
-        return fallback
-
-def fmt_date(d):
-    return d.strftime("%d/%m/%Y") if isinstance(d, (datetime, date)) else "—"
+@st.cache_data(max_entries=128, show_spinner=False)
+def render_barh_png(labels: tuple, values: tuple, title: str, xlabel: str, figsize: tuple,
+                    invert: bool = True, color: str = ACCENT, fig_bg: str = BG_SOFT, ax_bg: str = "#0B2C21") -> bytes:
+    """
+    Barras horizontais em PNG, cacheadas pelo conteúdo (rótulos, valores e estilo):
+    um rerun que não muda os dados do gráfico reaproveita os bytes sem rasterizar de novo.
+    """
+    return barh_png(labels, values, title, xlabel, figsize, invert, color, fig_bg, ax_bg)
 
-def safe_progress_value(percentual):
-    return max(0.0, min((percentual or 0.0)/100.0, 1.0))
+def barh_chart(labels, values, title, xlabel, figsize, invert=True):
+    png = render_barh_png(tuple(str(l) for l in labels), tuple(float(v) for v in values),
+                          title, xlabel, tuple(figsize), invert)
+    st.image(png, use_container_width=True)
 
-def df_to_csv_bytes(df: pd.DataFrame, include_index: bool = True) -> bytes:
-    return df.to_csv(index=include_index).encode("utf-8-sig")
+def _same_data(a, b) -> bool:
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+    return a is b
 
-def extract_stage_label_and_days(stage_text: str):
+def memo_per_dataset(slot: str, df: pd.DataFrame, build, *extra):
     """
-    Retorna (stage_sem_parenteses, dias:int) extraindo o último número dentro de parênteses.
-    Exemplos:
-      "USCIS Pending Decision (23 days)" -> ("USCIS Pending Decision", 23)
-      "Case denied (68 days)"            -> ("Case denied", 68)
-      "RFE Draft (14)"                   -> ("RFE Draft", 14)
-      "Stage (A) (7 days)"               -> ("Stage", 7)  # pega o último parêntese
+    build(df, *extra) guardado em session_state[slot]; refeito só quando o frame (ou extra) muda.
+    df pode ser uma tupla de frames (vários arquivos), comparados um a um.
     """
-    if not isinstance(stage_text, str):
-        return "", 0
-
-    # pegue todos os trechos com parênteses e extraia o último número
-    matches = re.findall(r"\(([^()]*)\)", stage_text)  # conteúdo dentro de cada (...)
-    days_val = 0
-    if matches:
-        last = matches[-1]
-        # tente formato "68 days" ou apenas "68"
-        m_num = re.search(r"(\d+)\s*(?:days?|dias?)?", last, flags=re.IGNORECASE)
-        if m_num:
-            try:
-                days_val = int(m_num.group(1))
-            except Exception:
-                days_val = 0
-
-    # remove TODOS os parênteses do rótulo final
-    stage_clean = re.sub(r"\s*\([^)]*\)", "", stage_text).strip()
-    return stage_clean, days_val
-
-# Prazos SOL por área (se precisar em outras telas)
-SOL_PRAZO = {
-    "FOIA": 30, "I-130": 30, "COS": 30, "B2-EXT": 30, "NPT": 60, "NVC": 60, "K1": 30,
-    "WAIVER": 90, "EB2-NIW": 120, "EB1": 90, "E2": 90, "O1": 90, "EB4": 90,
-    "AOS": 60, "ROC": 60, "NATZ": 30, "DA": 90, "PIP": 30, "I-90": 30, "COURT": 60,
-    "DOM": 30, "SIJS": 30, "VAWA": 90, "T-VISA": 120, "U-VISA": 90, "I-918B": 30,
-    "ASYLUM": 120, "PERM": 30, "EB3": 30
-}
+    memo = st.session_state.get(slot)
+    if memo is None or not _same_data(memo[0], df) or memo[1] != extra:
+        memo = (df, extra, build(df, *extra))
+        st.session_state[slot] = memo
+    return memo[2]
+
+def ref_date():
+    """Data de referência de todas as métricas: hoje, ou a data "as of" escolhida na sidebar."""
+    return st.session_state.get("ref_date") or datetime.now().date()
+
+def is_as_of() -> bool:
+    return ref_date() < datetime.now().date()
+
+def static_cases(df: pd.DataFrame) -> pd.DataFrame:
+    """Parte do enriquecimento que não depende da data (parse de stage e datas), uma vez por dataset."""
+    if st.session_state.get("incremental"):
+        return incremental_state(df)["static"]
+    return memo_per_dataset("_static_memo", df, enrich_static)
+
+def enriched_cases(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame enriquecido na data de referência; trocar a data não refaz o parse, só o último passo."""
+    return memo_per_dataset("_enriched_memo", df, lambda d, hoje, as_of: at_reference_date(static_cases(d), hoje, as_of),
+                            ref_date(), is_as_of())
+
+def sol_index(df: pd.DataFrame, only_active: bool) -> tuple:
+    """Índice de SOL do portfólio (com SOL inferida por SOL_PRAZO), montado uma vez por dataset/data."""
+    return memo_per_dataset("_sol_index", df, lambda d, a, hoje, as_of: build_sol_index(enriched_cases(d), a),
+                            only_active, ref_date(), is_as_of())
+
+def build_stage_analytics(df_stages: pd.DataFrame, hoje, as_of: bool = False) -> dict:
+    if as_of:
+        df_stages = history_as_of(df_stages, hoje)
+    iv = stage_intervals(df_stages, hoje)
+    tr = stage_transitions(iv)
+    return {"intervalos": iv, "medido": measured_stage_stats(iv), "transicoes": tr, "matriz": transition_matrix(tr)}
+
+def stage_analytics(df_stages: pd.DataFrame) -> dict:
+    """Durações medidas e transições do Histórico inteiro, calculadas uma vez por dataset/data."""
+    return memo_per_dataset("_stage_analytics", df_stages, build_stage_analytics, ref_date(), is_as_of())
+
+def has_history(df_stages) -> bool:
+    return df_stages is not None and not df_stages.empty and all(
+        c in df_stages.columns for c in ["Case Number","Case Stage","Start Date","End Date"])
+
+def dataset_summary(df: pd.DataFrame, summarize) -> pd.DataFrame:
+    """summarize(frame enriquecido), guardado por dataset/data — reruns sem troca de dados só leem o memo."""
+    name = summarize.__name__
+    if st.session_state.get("incremental") and not is_as_of() and name in INCREMENTAL_SUMMARIES:
+        tables = incremental_state(df)["tabelas"]
+        if name in tables:
+            return tables[name]
+    return memo_per_dataset(f"_summary_{summarize.__name__}", df,
+                            lambda d, hoje, as_of: summarize(enriched_cases(d)), ref_date(), is_as_of())
+
+def backlog(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Série de casos ativos por área (sweep-line sobre Open/Closed Date), uma vez por dataset/frequência."""
+    return memo_per_dataset("_backlog", df, lambda d, f, fim: backlog_series(static_cases(d), f, fim),
+                            freq, datetime.now().date())
+
+# =========================
+# ÍNDICES POR CASE NUMBER (montados uma vez por dataset)
+# =========================
+def case_index(df: pd.DataFrame) -> dict:
+    return memo_per_dataset("_case_index", df, build_case_index)
+
+def stage_history(df: pd.DataFrame, case_number) -> pd.DataFrame:
+    """Histórico do caso já ordenado por Start Date (lookup O(1))."""
+    ordered, groups = memo_per_dataset("_stage_index", df, build_stage_index)
+    return ordered.iloc[groups.get(str(case_number), [])]
 
 # =========================
 # SIDEBAR
@@ -113,6 +165,19 @@ SOL_PRAZO = {
 with st.sidebar:
     st.image(LOGO_URL, caption="USA4ALL", use_container_width=True)
     mode = st.radio("Preenchimento", ["A partir de arquivo", "Manual"])
+    debug = st.checkbox("🛠️ Painel de desempenho", value=False,
+                        help="Tempo, linhas e variação de memória de cada seção, por rerun.")
+    compact = st.checkbox("Armazenamento compacto", value=True,
+                          help="Datas em datetime64, Practice Area / Case Stage categóricos e Case Number inteiro.")
+    st.date_input("Data de referência (as of)", value=datetime.now().date(), max_value=datetime.now().date(),
+                  key="ref_date", format="DD/MM/YYYY",
+                  help="Recalcula as métricas como estavam nesta data (casos abertos até ela; fechados depois contam como ativos).")
+    st.checkbox("Atualização incremental", value=False, key="incremental",
+                help="Compara a exportação de Casos com o último snapshot salvo (Parquet) e recalcula só os casos e grupos que mudaram.")
+    st.text_input("Snapshot", key="snapshot_name", disabled=not st.session_state.get("incremental"),
+                  placeholder="ex.: escritório ou usuário",
+                  help="Nome do snapshot, obrigatório para gravar e comparar: a pasta dos snapshots é do servidor, "
+                       "compartilhada por todas as sessões.")
 
 st.title("🗂️ Panorama de Casos — USA4ALL")
 
@@ -123,44 +188,24 @@ if "df_cases" not in st.session_state:
     st.session_state.df_cases = None
 if "df_stages" not in st.session_state:
     st.session_state.df_stages = None
+if "_prof_log" not in st.session_state:
+    st.session_state._prof_log = []
+st.session_state._prof_run = st.session_state.get("_prof_run", 0) + 1
+
+def section(name: str, rows=None):
+    """Mede um bloco do app (tempo, linhas, memória) no log de desempenho da sessão."""
+    return profile_section(st.session_state._prof_log, name, rows, run=st.session_state._prof_run)
+
+def n_rows(df):
+    return None if df is None else len(df)
 
 # =========================
 # MAPEAMENTO
 # =========================
-CASES_FIELDS = {
-    "Case": ["Case","Caso","Cliente","Assunto"],
-    "Case Number": ["Case Number","Número do Caso","CaseNo","Case_ID","ID"],
-    "Practice Area": ["Practice Area","Área","Area","Tipo de Visto","Visto"],
-    "Case Stage": ["Case Stage","Stage","Status","Fase","Etapa"],
-    "Open Date": ["Open Date","Data de Abertura","Start Date","Início"],
-    "Closed Date": ["Closed Date","Data de Fechamento","End Date","Fechado em"],
-    "Statute of Limitations Date": ["Statute of Limitations Date","SOL","SOL Date","Prazo SOL","Limitation Date"],
-}
-
-STAGES_FIELDS = {
-    "Case Number": ["Case Number","Número do Caso","CaseNo","ID"],
-    "Case Stage": ["Case Stage","Stage","Status","Fase","Etapa"],
-    "Start Date": ["Start Date","Início","Data Inicial","Start"],
-    "End Date": ["End Date","Fim","Data Final","End"],
-}
-
-def suggest_mapping(df_cols, synonyms):
-    norm = {c: c.strip().lower() for c in df_cols if isinstance(c, str)}
-    for syn in synonyms:
-        s = syn.strip().lower()
-        for c, cl in norm.items():
-            if cl == s:
-                return c
-    for syn in synonyms:
-        s = syn.strip().lower()
-        for c, cl in norm.items():
-            if s in cl:
-                return c
-    return None
-
-def mapping_ui(df, expected_dict, title):
+def mapping_ui(cols, expected_dict, title) -> dict:
+    """Selectboxes do mapeamento (sugestão via suggest_mapping); retorna {campo: coluna do arquivo}."""
     st.markdown(f"#### 🔎 Mapeamento — {title}")
-    cols = list(df.columns)
+    cols = list(cols)
     options = ["(não usar)"] + cols
     mapping = {}
     l, r = st.columns(2)
@@ -174,107 +219,257 @@ def mapping_ui(df, expected_dict, title):
         for k in keys[half:]:
             sug = suggest_mapping(cols, expected_dict[k]) or "(não usar)"
             mapping[k] = st.selectbox(k, options, index=options.index(sug), key=f"map_{title}_{k}")
-
-    rename = {v: k for k, v in mapping.items() if v != "(não usar)"}
-    df2 = df.rename(columns=rename).copy()
-    # trim
-    for c in df2.columns:
-        if isinstance(c, str):
-            df2[c] = df2[c].apply(lambda x: x.strip() if isinstance(x, str) else x)
-    # datas
-    for dc in ["Open Date","Closed Date","Statute of Limitations Date","Start Date","End Date"]:
-        if dc in df2.columns:
-            df2[dc] = pd.to_datetime(df2[dc], errors="coerce", dayfirst=True).dt.date
+    return mapping
+
+def mapped_columns(mapping: dict) -> list:
+    """Colunas do arquivo usadas pelo mapeamento — as únicas que a leitura carrega."""
+    return list(dict.fromkeys(v for v in mapping.values() if v != "(não usar)"))
+
+def norm_key(digest, title, compact, mapping) -> tuple:
+    return ("norm", digest, title, compact, tuple(sorted(mapping.items())))
+
+def normalize_ui(df, mapping, title, digest=None, compact=True, normed=None):
+    # com digest, o frame normalizado é reaproveitado entre reruns (mesmo arquivo + mesmo mapeamento);
+    # normed é o frame já tirado do cache por quem chamou (aí df pode ser None) — não se consulta o
+    # cache de novo, porque a leitura de outro arquivo no meio pode ter tirado a entrada de lá
+    if normed is not None:
+        df2 = normed
+    elif digest is None:
+        df2 = normalize_mapped(df, mapping, compact=compact)
+    else:
+        df2 = ingest_cache_put(norm_key(digest, title, compact, mapping), normalize_mapped(df, mapping, compact=compact))
     st.success("✔️ Mapeamento aplicado.")
+    for dc, info in df2.attrs.get("date_report", {}).items():
+        if info.get("dayfirst"):
+            st.info(f"{dc}: {info['dayfirst']} linha(s) fora do formato {info['formato']} (ex.: texto digitado) "
+                    f"lidas como dia/mês/ano.")
+        if info["falhas"]:
+            st.warning(f"{dc}: {info['falhas']} linha(s) não reconhecidas como data (formato {info['formato']}); "
+                       f"primeiras linhas: {info['linhas']}")
+    if st.checkbox("Mostrar relatório de memória", key=f"mem_{title}"):
+        st.dataframe(memory_report(df, df2, mapping), use_container_width=True)
     return df2
 
 # =========================
-# UPLOADS
+# CACHE DE INGESTÃO
+# Chave = hash do conteúdo do upload (+ mapeamento escolhido, para o frame normalizado).
+# LRU compartilhado entre reruns, limitado por INGEST_CACHE_MAX_MB.
 # =========================
-df_cases = None
-df_stages = None
-selected_case = None
-
-if mode == "A partir de arquivo":
-    st.subheader("📂 Upload de Arquivos")
-    up1 = st.file_uploader("Casos (CSV/XLS/XLSX)", type=["csv","xls","xlsx"], key="up_cases")
-    up2 = st.file_uploader("Histórico de Estágios (opcional) — colunas: Case Number, Case Stage, Start Date, End Date",
-                           type=["csv","xls","xlsx"], key="up_stages")
-
-    if up1:
+INGEST_CACHE_MAX_MB = float(os.environ.get("PANORAMA_CACHE_MB", 512))
+# limites por arquivo na leitura (linhas / MB das colunas carregadas); acima disso a leitura para com erro
+INGEST_MAX_ROWS = int(os.environ.get("PANORAMA_MAX_ROWS", 2_000_000))
+INGEST_MAX_MB = float(os.environ.get("PANORAMA_MAX_READ_MB", 1024))
+
+@st.cache_resource
+def _ingest_cache():
+    return {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def ingest_cache_get(key):
+    store = _ingest_cache()
+    with store["lock"]:
+        hit = store["entries"].get(key)
+        if hit is None:
+            return None
+        store["entries"].move_to_end(key)
+        return hit[0]
+
+def ingest_cache_put(key, df: pd.DataFrame) -> pd.DataFrame:
+    """Guarda df no LRU; remove os mais antigos até caber no teto de memória."""
+    store = _ingest_cache()
+    cap = INGEST_CACHE_MAX_MB * 1024 * 1024
+    size = _frame_nbytes(df)
+    with store["lock"]:
+        old = store["entries"].pop(key, None)
+        if old is not None:
+            store["bytes"] -= old[1]
+        if size > cap:
+            return df  # maior que o teto: não cacheia
+        store["entries"][key] = (df, size)
+        store["bytes"] += size
+        while store["bytes"] > cap and store["entries"]:
+            _, (_, s) = store["entries"].popitem(last=False)
+            store["bytes"] -= s
+    return df
+
+def file_digest(up) -> str:
+    return hashlib.sha256(up.getvalue()).hexdigest()
+
+def upload_header(up, digest) -> list:
+    """Nomes das colunas do arquivo (só a primeira linha), cacheados por conteúdo."""
+    key = ("header", digest)
+    head = ingest_cache_get(key)
+    if head is None:
+        head = ingest_cache_put(key, pd.DataFrame(columns=read_header(io.BytesIO(up.getvalue()), up.name)))
+    return list(head.columns)
+
+def read_uploads(ups, digests, usecols) -> list:
+    """
+    Lê em streaming as colunas usecols[i] de cada arquivo. O cache é por coluna (conteúdo + coluna):
+    mudar o mapeamento só lê as colunas que ainda não foram carregadas.
+    Um arquivo a ler: barra de progresso por bloco. Vários: lidos em paralelo — com Excel, em
+    processos (openpyxl é Python puro, preso ao GIL); só CSV, em threads — e a barra avança por arquivo.
+    """
+    cached = [{c: ingest_cache_get(("col", d, c)) for c in cols} for d, cols in zip(digests, usecols)]
+    missing = [[c for c, v in got.items() if v is None] for got in cached]
+    todo = [i for i, cols in enumerate(missing) if cols]
+    read = {}
+    if todo:
+        bar = st.progress(0.0, text="Lendo arquivos…")
         try:
-            raw_cases = pd.read_excel(up1) if up1.name.lower().endswith((".xls",".xlsx")) else pd.read_csv(up1)
-            with st.expander("Ajustar colunas (Casos)"):
-                df_cases = mapping_ui(raw_cases, CASES_FIELDS, "Casos")
-            st.session_state.df_cases = df_cases
-            st.success("✅ Casos carregados.")
-            st.dataframe(df_cases.head(50), use_container_width=True)
-        except Exception as e:
-            st.error(f"Erro ao ler Casos: {e}")
+            if len(todo) == 1:
+                i = todo[0]
+                def progress(rows, frac):
+                    bar.progress(frac or 0.0, text=f"{ups[i].name}: {rows:,} linhas lidas")
+                read[i] = read_table_streaming(io.BytesIO(ups[i].getvalue()), ups[i].name, missing[i],
+                                               max_rows=INGEST_MAX_ROWS, max_mb=INGEST_MAX_MB, on_progress=progress)
+            else:
+                excel = any(not ups[i].name.lower().endswith(".csv") for i in todo)
+                pool_cls = ProcessPoolExecutor if excel else ThreadPoolExecutor
+                with pool_cls(max_workers=min(len(todo), os.cpu_count() or 1)) as pool:
+                    futures = {pool.submit(read_table_streaming, io.BytesIO(ups[i].getvalue()), ups[i].name, missing[i],
+                                           max_rows=INGEST_MAX_ROWS, max_mb=INGEST_MAX_MB): i for i in todo}
+                    for n, fut in enumerate(as_completed(futures), start=1):
+                        i = futures[fut]
+                        try:
+                            read[i] = fut.result()
+                        except Exception as e:
+                            raise ValueError(f"{ups[i].name}: {e}") from e
+                        bar.progress(n / len(todo), text=f"{n}/{len(todo)} arquivos lidos")
+        finally:
+            bar.empty()
+    raws = []
+    for i, (d, got) in enumerate(zip(digests, cached)):
+        for c in missing[i]:
+            got[c] = ingest_cache_put(("col", d, c), read[i][[c]])
+        raws.append(pd.concat(list(got.values()), axis=1) if got else pd.DataFrame())
+    return raws
+
+def load_uploads(ups, expected_dict, label: str, title: str, merge, *merge_args):
+    """
+    Lê o cabeçalho de cada arquivo, mostra o mapeamento (um por arquivo), carrega só as colunas
+    mapeadas e, com mais de um arquivo, junta com merge(frames, *merge_args, compact).
+    Com um arquivo só, devolve o frame normalizado dele.
+    """
+    digests = [file_digest(up) for up in ups]
+    boxes, titles, mappings = [], [], []
+    for i, (up, dig) in enumerate(zip(ups, digests), start=1):
+        nome = "" if len(ups) == 1 else f" — {i}. {up.name}"
+        box = st.expander(f"Ajustar colunas ({label}{nome})")
+        with box:
+            mappings.append(mapping_ui(upload_header(up, dig), expected_dict, title + nome))
+        boxes.append(box)
+        titles.append(title + nome)
+    # só lê o arquivo se o frame normalizado não estiver no cache (ou se o relatório de memória pedir o bruto)
+    normed = [ingest_cache_get(norm_key(d, t, compact, m)) for d, t, m in zip(digests, titles, mappings)]
+    need = [n is None or st.session_state.get(f"mem_{t}") for n, t in zip(normed, titles)]
+    raws = [None] * len(ups)
+    with section(f"Leitura {label}") as sec:
+        idx = [i for i, n in enumerate(need) if n]
+        if idx:
+            lidos = read_uploads([ups[i] for i in idx], [digests[i] for i in idx], [mapped_columns(mappings[i]) for i in idx])
+            for i, raw in zip(idx, lidos):
+                raws[i] = raw
+        sec["linhas"] = sum(len(raw) for raw in raws if raw is not None)
+    frames = []
+    for raw, dig, box, t, m, n in zip(raws, digests, boxes, titles, mappings, normed):
+        with section(f"Mapeamento {label}", rows=n_rows(raw)), box:
+            frames.append(normalize_ui(raw, m, t, digest=dig, compact=compact, normed=n))
+    if len(frames) == 1:
+        return frames[0]
+    total = sum(map(len, frames))
+    with section(f"Consolidação {label}", rows=total):
+        df = memo_per_dataset(f"_merge_{title}", tuple(frames), lambda fs, *a: merge(list(fs), *a),
+                              *merge_args, compact)
+    st.caption(f"{len(frames)} arquivos, {total} linhas → {len(df)} após remover Case Numbers repetidos.")
+    return df
 
-    if up2:
-        try:
-            raw_stages = pd.read_excel(up2) if up2.name.lower().endswith((".xls",".xlsx")) else pd.read_csv(up2)
-            with st.expander("Ajustar colunas (Histórico)"):
-                df_stages = mapping_ui(raw_stages, STAGES_FIELDS, "Estágios")
-            st.session_state.df_stages = df_stages
-            st.success("✅ Histórico de Estágios carregado.")
-            st.dataframe(df_stages.head(50), use_container_width=True)
-        except Exception as e:
-            st.error(f"Erro ao ler Estágios: {e}")
+# =========================
+# ATUALIZAÇÃO INCREMENTAL
+# Dataset de Casos confirmado, normalizado em Parquet (uma pasta por snapshot em SNAPSHOT_DIR);
+# cada carga nova é comparada com ele.
+# =========================
+SNAPSHOT_DIR = os.environ.get("PANORAMA_SNAPSHOT_DIR", os.path.join(os.path.expanduser("~"), ".panorama", "snapshot"))
 
-    if st.session_state.df_cases is not None:
-        df_cases = st.session_state.df_cases
-    if st.session_state.df_stages is not None:
-        df_stages = st.session_state.df_stages
+def snapshot_dir():
+    """
+    Pasta do snapshot com o nome da sidebar, ou None sem nome. Não há nome padrão: SNAPSHOT_DIR é
+    compartilhado por todas as sessões, e um padrão (ex.: o nome do arquivo) misturaria usuários.
+    """
+    nome = re.sub(r"[^\w.-]+", "_", st.session_state.get("snapshot_name", "").strip())[:80].strip(".")
+    return os.path.join(SNAPSHOT_DIR, nome) if nome else None
+
+def incremental_state(df: pd.DataFrame) -> dict:
+    """incremental_refresh do dataset carregado contra o snapshot atual, uma vez por dataset/snapshot."""
+    return memo_per_dataset("_incremental", df, lambda d, p: incremental_refresh(p, d), snapshot_dir())
+
+def change_summary(df: pd.DataFrame, inc: dict):
+    """Diff contra o snapshot e o botão que grava o dataset atual como novo snapshot."""
+    diff = inc["diff"]
+    if snapshot_dir() is None:
+        st.button("Confirmar snapshot", key="confirm_snapshot", disabled=True)
+        st.info("Dê um nome ao snapshot na sidebar para gravar este dataset e comparar as próximas cargas com ele. "
+                "Por enquanto, tudo é calculado do zero.")
+        return
+    nome = os.path.basename(snapshot_dir())
+    if st.button(f"Confirmar snapshot \"{nome}\"", key="confirm_snapshot",
+                 help="Grava este dataset como base das próximas comparações."):
+        save_snapshot(snapshot_dir(), df, inc["static"], inc["tabelas"])
+        st.session_state.pop("_incremental", None)
+        st.success(f"Snapshot \"{nome}\" salvo.")
+        return
+    if diff is None:
+        st.info(f"Sem snapshot \"{nome}\" compatível: tudo calculado do zero. Confirme para comparar as próximas cargas com este dataset.")
+        return
+    stage = diff["mudancas_stage"]
+    st.caption(f"Comparado com o snapshot \"{nome}\" de {inc['anterior']:%d/%m/%Y %H:%M}.")
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Novos", f"{len(diff['novos'])}")
+    c2.metric("Removidos", f"{len(diff['removidos'])}")
+    c3.metric("Alterados", f"{len(diff['alterados'])}")
+    c4.metric("Mudaram de stage", f"{len(stage)}")
+    if len(stage):
+        with st.expander(f"{len(stage)} casos mudaram de stage"):
+            st.dataframe(stage, use_container_width=True, hide_index=True)
 
+# =========================
+# PAINEL DO CASE SELECIONADO (fragmento)
+# Interações aqui (selectbox do cliente) reexecutam só esta função.
+# =========================
+@st.fragment
+@profiled(lambda: st.session_state._prof_log, "Painel do cliente", lambda: st.session_state._prof_run)
+def case_panel(df_cases, df_stages):
+    selected_case = None
     # Seletor de cliente
     if df_cases is not None and "Case Number" in df_cases.columns:
         st.subheader("🔎 Selecione um cliente")
-        opts = df_cases["Case Number"].dropna().astype(str).unique().tolist()
+        opts = list(case_index(df_cases))
         if opts:
             selected_case = st.selectbox("Case Number", opts)
 
-    # ======= PAINEL DO CASE SELECIONADO =======
     if selected_case and df_cases is not None:
-        row = df_cases[df_cases["Case Number"].astype(str) == str(selected_case)].iloc[0].to_dict()
+        row = df_cases.iloc[case_index(df_cases)[str(selected_case)]].to_dict()
         nome          = row.get("Case","")
         area          = row.get("Practice Area","")
         case_stage    = row.get("Case Stage","")
-        open_date     = parse_date(row.get("Open Date"))
-        sol_date      = parse_date(row.get("Statute of Limitations Date"))
+        open_date     = as_date(row.get("Open Date"))
+        sol_date      = as_date(row.get("Statute of Limitations Date"))
 
         stage_clean, stage_days = extract_stage_label_and_days(case_stage)
 
         st.markdown(f"### 📌 {area or '—'} • **{nome or '—'}**  \n**Case Number:** {selected_case}")
         st.caption(f"Stage atual: **{stage_clean or '—'}**  |  dias no stage (via '()'): **{stage_days}**")
 
-        # === TEMPO DO PROCESSO (SEMPRE ATÉ HOJE) ===
-        hoje = datetime.now().date()
-        if open_date:
-            base_days = (hoje - open_date).days
-            if base_days < 0: base_days = 0
-        else:
-            base_days = 0
-
-        # Regra: só SUBTRAI os dias entre () se USCIS Pending Decision
-        if "USCIS PENDING DECISION" in (stage_clean or "").upper():
-            tempo_processo = max(0, base_days - stage_days)
-        else:
-            tempo_processo = base_days
-
-        # Progresso vs SOL (informativo)
-        if open_date and sol_date:
-            tot = (sol_date - open_date).days
-            dec = (hoje - open_date).days
-            rest = (sol_date - hoje).days
-            perc = round((dec/tot)*100,2) if tot>0 else (100.0 if hoje>=sol_date else 0.0)
-        else:
-            tot=dec=rest=0; perc=0.0
+        # === TEMPO DO PROCESSO (ATÉ A DATA DE REFERÊNCIA) ===
+        hoje = ref_date()
+        m = case_metrics(open_date, sol_date, stage_clean, stage_days, hoje)
+        tempo_processo, rest, perc = m["tempo_processo"], m["dias_ate_sol"], m["progresso_sol"]
 
         c1,c2,c3,c4 = st.columns(4)
         c1.metric("Tempo do processo (dias)", f"{tempo_processo}")
-        c2.metric("Dias desde Open Date", f"{max((hoje - open_date).days if open_date else 0, 0)}")
+        c2.metric("Dias desde Open Date", f"{m['dias_desde_open']}")
         c3.metric("Dias até SOL", f"{max(rest,0)}")
         c4.metric("Progresso do SOL", f"{perc:.2f}%")
         st.progress(safe_progress_value(perc))
@@ -292,116 +487,172 @@ if mode == "A partir de arquivo":
         # --- GRÁFICO: duração por Case Stage (apenas com cliente selecionado)
         st.subheader("⏱️ Duração por Case Stage — Cliente selecionado")
         if df_stages is not None and all(c in df_stages.columns for c in ["Case Number","Case Stage","Start Date","End Date"]):
-            hist = df_stages[df_stages["Case Number"].astype(str)==str(selected_case)].copy()
+            hist = stage_history(df_stages, selected_case).copy()
+            if is_as_of():
+                hist = history_as_of(hist, hoje)
             if not hist.empty:
-                # Duração real Start→End; se End vazio, usa hoje
-                def dur(r):
-                    sd = parse_date(r.get("Start Date"))
-                    ed = parse_date(r.get("End Date"), fallback=hoje)
-                    if sd and ed and ed >= sd:
-                        return (ed - sd).days
-                    return 0
-                hist["Dias"] = hist.apply(dur, axis=1)
-                # Ordena por início
-                hist["Start Date"] = pd.to_datetime(hist["Start Date"], errors="coerce", dayfirst=True).dt.date
-                hist["End Date"]   = pd.to_datetime(hist["End Date"], errors="coerce", dayfirst=True).dt.date
-                hist = hist.sort_values("Start Date")
-
-                fig_h = max(3, 0.5 * len(hist))
-                fig, ax = plt.subplots(figsize=(10, fig_h))
-                y = range(len(hist))
-                ax.barh(y, hist["Dias"].tolist(), color=ACCENT)
+                # Duração real Start→End; se End vazio, usa hoje (colunas já normalizadas, sem re-parse)
+                hist["Dias"] = stage_durations(hist, hoje)
+                # (já vem ordenado por início)
+                hist["Start Date"] = pd.to_datetime(hist["Start Date"], errors="coerce").dt.date
+                hist["End Date"]   = pd.to_datetime(hist["End Date"], errors="coerce").fillna(pd.Timestamp(hoje)).dt.date
                 labels = [
-                    f"{r['Case Stage']} ({fmt_date(r['Start Date'])} → {fmt_date(r['End Date'] or hoje)})"
-                    for _, r in hist.iterrows()
+                    f"{cs} ({fmt_date(sd)} → {fmt_date(ed or hoje)})"
+                    for cs, sd, ed in zip(hist["Case Stage"], hist["Start Date"], hist["End Date"])
                 ]
-                ax.set_yticks(list(y))
-                ax.set_yticklabels(labels)
-                ax.invert_yaxis()
-                ax.set_xlabel("Dias")
-                ax.set_title("Tempo em cada Stage")
-                fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-                st.pyplot(fig, clear_figure=True)
+                barh_chart(labels, hist["Dias"], "Tempo em cada Stage", "Dias", (10, max(3, 0.5 * len(hist))))
             else:
                 # fallback: usa o número entre parênteses do stage atual
                 if stage_days > 0:
-                    fig, ax = plt.subplots(figsize=(8, 2.8))
-                    ax.barh([stage_clean or "(Stage atual)"], [stage_days], color=ACCENT)
-                    ax.set_xlabel("Dias")
-                    ax.set_title("Duração do stage atual (via '()')")
-                    fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-                    st.pyplot(fig, clear_figure=True)
+                    barh_chart([stage_clean or "(Stage atual)"], [stage_days], "Duração do stage atual (via '()')", "Dias", (8, 2.8), invert=False)
                 else:
                     st.info("Sem histórico e sem dias '()' no Case Stage atual.")
         else:
             # Sem histórico: usa o '()' do stage atual
             if stage_days > 0:
-                fig, ax = plt.subplots(figsize=(8, 2.8))
-                ax.barh([stage_clean or "(Stage atual)"], [stage_days], color=ACCENT)
-                ax.set_xlabel("Dias")
-                ax.set_title("Duração do stage atual (via '()')")
-                fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-                st.pyplot(fig, clear_figure=True)
+                barh_chart([stage_clean or "(Stage atual)"], [stage_days], "Duração do stage atual (via '()')", "Dias", (8, 2.8), invert=False)
             else:
                 st.info("Envie o Histórico de Estágios para detalhar por estágio ou inclua dias entre '()' no Case Stage.")
 
+# =========================
+# UPLOADS
+# =========================
+df_cases = None
+df_stages = None
+
+if mode == "A partir de arquivo":
+    st.subheader("📂 Upload de Arquivos")
+    up1 = st.file_uploader("Casos (CSV/XLS/XLSX) — um ou mais arquivos", type=["csv","xls","xlsx"],
+                           key="up_cases", accept_multiple_files=True)
+    up2 = st.file_uploader("Histórico de Estágios (opcional) — colunas: Case Number, Case Stage, Start Date, End Date",
+                           type=["csv","xls","xlsx"], key="up_stages", accept_multiple_files=True)
+
+    if up1:
+        try:
+            order_by = None
+            if len(up1) > 1:
+                regras = {"do último arquivo da lista": None, "com Closed Date mais recente": "Closed Date",
+                          "com Open Date mais recente": "Open Date"}
+                regra = st.selectbox("Case Number repetido entre arquivos — fica a linha", list(regras), key="dedupe_rule",
+                                     help="Empates e datas vazias ficam com o arquivo mais ao fim da lista.")
+                order_by = regras[regra]
+            df_cases = load_uploads(up1, CASES_FIELDS, "Casos", "Casos", merge_cases, order_by)
+            st.session_state.df_cases = df_cases
+            st.success("✅ Casos carregados.")
+            if st.session_state.get("incremental"):
+                with section("Atualização incremental", rows=len(df_cases)):
+                    change_summary(df_cases, incremental_state(df_cases))
+            st.dataframe(df_cases.head(50), use_container_width=True)
+        except Exception as e:
+            st.error(f"Erro ao ler Casos: {e}")
+
+    if up2:
+        try:
+            df_stages = load_uploads(up2, STAGES_FIELDS, "Histórico", "Estágios", merge_history)
+            st.session_state.df_stages = df_stages
+            st.success("✅ Histórico de Estágios carregado.")
+            st.dataframe(df_stages.head(50), use_container_width=True)
+        except Exception as e:
+            st.error(f"Erro ao ler Estágios: {e}")
+
+    if st.session_state.df_cases is not None:
+        df_cases = st.session_state.df_cases
+    if st.session_state.df_stages is not None:
+        df_stages = st.session_state.df_stages
+
+    # painel do cliente roda como fragmento: trocar o Case Number não reexecuta as seções do portfólio
+    if df_cases is not None:
+        case_panel(df_cases, df_stages)
+
 # =========================
 # OVERVIEW POR ÁREA (ATIVOS)
 # =========================
-st.subheader("🏢 Overview do Departamento — Casos ativos por Practice Area")
-dfc = st.session_state.df_cases
-if dfc is not None and not dfc.empty and "Practice Area" in dfc.columns and "Case Stage" in dfc.columns:
-    x = dfc.copy()
-    x["Practice Area"] = x["Practice Area"].astype(str).str.strip()
-    def is_active(stage):
-        s = str(stage).upper()
-        return not(("APPROVED" in s) or ("DENIED" in s) or ("CLOSED" in s))
-    x["Ativo"] = x["Case Stage"].apply(is_active)
-    resumo = x.groupby("Practice Area")["Ativo"].sum().sort_values(ascending=False).reset_index(name="Casos Ativos")
-    st.dataframe(resumo, use_container_width=True)
-
-    fig, ax = plt.subplots(figsize=(10, max(3, 0.5*len(resumo))))
-    ax.barh(resumo["Practice Area"], resumo["Casos Ativos"], color=ACCENT)
-    ax.invert_yaxis()
-    ax.set_xlabel("Casos ativos")
-    ax.set_title("Ativos por Practice Area")
-    fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-    st.pyplot(fig, clear_figure=True)
-else:
-    st.caption("Carregue o arquivo de **Casos** com colunas 'Practice Area' e 'Case Stage'.")
+with section("Overview (ativos por área)", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("🏢 Overview do Departamento — Casos ativos por Practice Area")
+    dfc = st.session_state.df_cases
+    if dfc is not None and not dfc.empty and "Practice Area" in dfc.columns and "Case Stage" in dfc.columns:
+        resumo = dataset_summary(dfc, active_by_area)
+        st.dataframe(resumo, use_container_width=True)
+
+        barh_chart(resumo["Practice Area"], resumo["Casos Ativos"], "Ativos por Practice Area", "Casos ativos", (10, max(3, 0.5*len(resumo))))
+    else:
+        st.caption("Carregue o arquivo de **Casos** com colunas 'Practice Area' e 'Case Stage'.")
+
+# =========================
+# BACKLOG AO LONGO DO TEMPO (casos ativos por área, diário ou semanal)
+# =========================
+with section("Backlog ao longo do tempo", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("📈 Backlog ao longo do tempo — Casos ativos por Practice Area")
+    dfb = st.session_state.df_cases
+    if dfb is not None and not dfb.empty and "Open Date" in dfb.columns:
+        b1, b2 = st.columns([1, 3])
+        freq = b1.radio("Granularidade", ["Diário", "Semanal"], horizontal=True, key="backlog_freq")
+        serie = backlog(dfb, "D" if freq == "Diário" else "W").loc[:pd.Timestamp(ref_date())]
+        if serie.empty:
+            st.info("Nenhum caso com Open Date válida.")
+        else:
+            sel = b2.multiselect("Practice Area (vazio = todas)", list(serie.columns), key="backlog_areas")
+            if sel:
+                serie = serie[sel]
+            if "Closed Date" not in dfb.columns:
+                st.caption("Sem 'Closed Date' mapeada: todo caso conta como ativo desde a abertura.")
+            st.line_chart(serie, use_container_width=True)
+            st.download_button("⬇️ Baixar backlog (CSV)", data=df_to_csv_bytes(serie, include_index=True),
+                               file_name="backlog_por_area.csv", mime="text/csv")
+    else:
+        st.caption("Carregue **Casos** com 'Open Date' (e 'Closed Date', se houver) para a série de backlog.")
 
 # =========================
 # DIAS POR CASE STAGE (GERAL, via "()")
 # =========================
-st.subheader("📊 Dias por Case Stage (geral) — usando número entre '()' do campo Case Stage")
-dfc2 = st.session_state.df_cases
-if dfc2 is not None and not dfc2.empty and "Case Stage" in dfc2.columns:
-    tmp = dfc2.copy()
-    labels, values = [], []
-    for s in tmp["Case Stage"].astype(str):
-        sc, sd = extract_stage_label_and_days(s)
-        labels.append(sc)
-        values.append(sd)
-    tmp["Stage Clean"] = labels
-    tmp["Stage Days"]  = values
-
-    tmp = tmp[(tmp["Stage Clean"].astype(str).str.strip() != "") & (tmp["Stage Days"] > 0)]
-    if tmp.empty:
-        st.info("Nenhum valor entre '()' encontrado nos Case Stages.")
+with section("Dias por Case Stage", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("📊 Dias por Case Stage (geral)")
+    dfc2 = st.session_state.df_cases
+    fonte = "'()'"
+    if has_history(st.session_state.df_stages):
+        fonte = st.radio("Fonte dos dias", ["Histórico (medido)", "Número entre '()' do Case Stage"],
+                         horizontal=True, key="stage_days_source")
+    if fonte == "Histórico (medido)":
+        stats = stage_analytics(st.session_state.df_stages)["medido"].rename(columns={"Stage": "Stage Clean"})
+        if stats.empty:
+            st.info("Nenhum intervalo fechado (Start e End preenchidos) no Histórico de Estágios.")
+        else:
+            st.caption("Permanência real Start→End de todos os intervalos fechados do Histórico.")
+            st.dataframe(stats, use_container_width=True)
+            barh_chart(stats["Stage Clean"], stats["Média (dias)"], "Média de dias por Case Stage (medido)", "Média de dias (Histórico)",
+                       (10, max(3, 0.45*len(stats))))
+    elif dfc2 is not None and not dfc2.empty and "Case Stage" in dfc2.columns:
+        stats = dataset_summary(dfc2, stage_day_stats)
+        if stats.empty:
+            st.info("Nenhum valor entre '()' encontrado nos Case Stages.")
+        else:
+            st.dataframe(stats, use_container_width=True)
+
+            barh_chart(stats["Stage Clean"], stats["Média (dias)"], "Média de dias por Case Stage (geral)", "Média de dias (via '()')",
+                       (10, max(3, 0.45*len(stats))))
     else:
-        stats = tmp.groupby("Stage Clean")["Stage Days"].agg(["count","mean","median","max"]).round(1).sort_values("mean", ascending=False).reset_index()
-        stats = stats.rename(columns={"count":"#Casos", "mean":"Média (dias)", "median":"Mediana", "max":"Máx"})
-        st.dataframe(stats, use_container_width=True)
+        st.caption("Carregue o arquivo de **Casos** com 'Case Stage' para calcular o gráfico de médias por stage.")
 
-        fig, ax = plt.subplots(figsize=(10, max(3, 0.45*len(stats))))
-        ax.barh(stats["Stage Clean"], stats["Média (dias)"], color=ACCENT)
-        ax.invert_yaxis()
-        ax.set_xlabel("Média de dias (via '()')")
-        ax.set_title("Média de dias por Case Stage (geral)")
-        fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-        st.pyplot(fig, clear_figure=True)
-else:
-    st.caption("Carregue o arquivo de **Casos** com 'Case Stage' para calcular o gráfico de médias por stage.")
+# =========================
+# TRANSIÇÕES ENTRE ESTÁGIOS (HISTÓRICO COMPLETO)
+# =========================
+with section("Transições entre estágios", rows=n_rows(st.session_state.df_stages)):
+    st.subheader("🔁 Transições entre estágios — Histórico completo")
+    dfh = st.session_state.df_stages
+    if has_history(dfh):
+        an = stage_analytics(dfh)
+        tr = an["transicoes"]
+        if tr.empty:
+            st.info("Nenhum caso com mais de um estágio no Histórico.")
+        else:
+            st.caption("Permanência (dias) no stage de origem antes de cada transição.")
+            st.dataframe(tr, use_container_width=True, hide_index=True)
+            with st.expander("Matriz de transições (contagens)"):
+                st.dataframe(an["matriz"], use_container_width=True)
+            st.download_button("⬇️ Baixar transições (CSV)", data=df_to_csv_bytes(tr, include_index=False),
+                               file_name="transicoes_estagios.csv", mime="text/csv")
+    else:
+        st.caption("Carregue o **Histórico de Estágios** (Case Number, Case Stage, Start Date, End Date) para as transições.")
 
 # =========================
 # ESTIMATIVA: TEMPO MÉDIO DE CONCLUSÃO POR ÁREA
@@ -410,76 +661,107 @@ else:
 #  - Se Case Stage contiver "USCIS Pending Decision (X)", SUBTRAI X do total
 #  - SOL overrun = max(0, HOJE − SOL)
 # =========================
-st.subheader("⏳ Estimativa — Tempo médio de conclusão por Practice Area (exclui 'USCIS Pending Decision' via '()') + SOL")
-
-cases_est = st.session_state.df_cases
-if cases_est is not None and not cases_est.empty and all(c in cases_est.columns for c in ["Open Date","Case Stage","Practice Area"]):
-    c = cases_est.copy()
-    c["Open Date"] = c["Open Date"].apply(parse_date)
-    c["Statute of Limitations Date"] = c["Statute of Limitations Date"].apply(parse_date) if "Statute of Limitations Date" in c.columns else None
-    c["Practice Area"] = c["Practice Area"].astype(str).str.strip()
-
-    # extrai label e dias de "()"
-    stage_clean, stage_days = [], []
-    for s in c["Case Stage"].astype(str):
-        sc, sd = extract_stage_label_and_days(s)
-        stage_clean.append(sc)
-        stage_days.append(sd)
-    c["Stage Clean"] = stage_clean
-    c["Stage Days"]  = stage_days
-
-    hoje = datetime.now().date()
-    rows = []
-    for _, r in c.iterrows():
-        od  = r.get("Open Date")
-        area= r.get("Practice Area") or "(sem área)"
-        sc  = (r.get("Stage Clean") or "").upper()
-        sd  = int(r.get("Stage Days") or 0)
-        sol = r.get("Statute of Limitations Date") if isinstance(c.get("Statute of Limitations Date"), pd.Series) else None
-
-        if not od:
-            continue
-
-        total = (hoje - od).days
-        if total < 0: total = 0
-
-        if "USCIS PENDING DECISION" in sc:
-            adj = max(0, total - sd)
+with section("Estimativa", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("⏳ Estimativa — Tempo médio de conclusão por Practice Area (exclui 'USCIS Pending Decision' via '()') + SOL")
+
+    cases_est = st.session_state.df_cases
+    if cases_est is not None and not cases_est.empty and all(c in cases_est.columns for c in ["Open Date","Case Stage","Practice Area"]):
+        resumo = dataset_summary(cases_est, completion_summary)
+
+        if resumo.empty:
+            st.info("Sem dados suficientes (verifique Open Date / Case Stage / Practice Area).")
         else:
-            adj = total
+            st.dataframe(resumo, use_container_width=True)
 
-        over = 0
-        if sol:
-            over = max(0, (hoje - sol).days)
+            barh_chart(resumo["Practice Area"], resumo["media_tempo_conclusao"], "Tempo médio de conclusão (ajustado) por Practice Area",
+                       "Dias (média ajustada)", (10, max(3, 0.5*len(resumo))))
 
-        rows.append({"Practice Area": area, "AdjCompletionDays": adj, "SOL_OverrunDays": over})
+            st.download_button(
+                "⬇️ Baixar estimativas por área (CSV)",
+                data=df_to_csv_bytes(resumo, include_index=False),
+                file_name="estimativas_conclusao_por_area.csv",
+                mime="text/csv"
+            )
+    else:
+        st.caption("Carregue **Casos** com Open Date / Case Stage / Practice Area para a estimativa.")
 
-    if not rows:
-        st.info("Sem dados suficientes (verifique Open Date / Case Stage / Practice Area).")
+# =========================
+# PRAZOS SOL — PORTFÓLIO
+# Todos os casos que vencem nos próximos N dias (ou já ultrapassados), via índice ordenado de SOL.
+# Sem SOL na planilha, a data é inferida por Open Date + SOL_PRAZO da Practice Area.
+# =========================
+with section("Prazos SOL (portfólio)", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("⏰ Prazos SOL — portfólio")
+    dfs = st.session_state.df_cases
+    if dfs is not None and not dfs.empty and ("Statute of Limitations Date" in dfs.columns or
+                                              {"Open Date","Practice Area"} <= set(dfs.columns)):
+        s1, s2, s3 = st.columns(3)
+        consulta = s1.radio("Consulta", ["Vencem nos próximos N dias", "Já ultrapassados"], key="sol_query")
+        n_dias = s2.number_input("N (dias)", min_value=0, max_value=3650, value=30, step=5, key="sol_n")
+        so_ativos = s3.checkbox("Só casos ativos", value=True, key="sol_ativos")
+
+        hoje = ref_date()
+        idx = sol_index(dfs, so_ativos)
+        vencendo = sol_due_within(idx, hoje, int(n_dias))
+        vencidos = sol_overrun(idx, hoje)
+        m1, m2, m3 = st.columns(3)
+        m1.metric(f"Vencem em ≤ {int(n_dias)} dias", f"{len(vencendo)}")
+        m2.metric("SOL ultrapassado", f"{len(vencidos)}")
+        m3.metric("Com SOL inferida", f"{int(idx[3][idx[1]].sum())}")
+
+        pos = vencendo if consulta.startswith("Vencem") else vencidos
+        tabela = sol_table(enriched_cases(dfs), idx, pos, hoje)
+        st.dataframe(tabela, use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Baixar prazos SOL (CSV)", data=df_to_csv_bytes(tabela, include_index=False),
+                           file_name="prazos_sol.csv", mime="text/csv")
     else:
-        est = pd.DataFrame(rows)
-        resumo = est.groupby("Practice Area").agg(
-            casos=("AdjCompletionDays","count"),
-            media_tempo_conclusao=("AdjCompletionDays","mean"),
-            media_sol_ultrapasso=("SOL_OverrunDays","mean"),
-            pct_ultrapassados=("SOL_OverrunDays", lambda s: 100.0 * (s.gt(0).sum()/max(len(s),1)))
-        ).round(1).sort_values("media_tempo_conclusao", ascending=False).reset_index()
+        st.caption("Carregue **Casos** com SOL (ou Open Date + Practice Area) para a triagem de prazos.")
 
-        st.dataframe(resumo, use_container_width=True)
+# =========================
+# RELATÓRIOS EM LOTE (um DOCX por Case Number, em ZIP)
+# Gerados em paralelo (processos) e gravados conforme ficam prontos num ZIP em memória (io.BytesIO):
+# o arquivo inteiro fica em session_state até a próxima geração e é reaproveitado pelo botão de download.
+# =========================
+with section("Relatórios DOCX", rows=n_rows(st.session_state.df_cases)):
+    st.subheader("📄 Relatórios por cliente — DOCX em lote")
+    dfr = st.session_state.df_cases
+    if dfr is not None and not dfr.empty and "Case Number" in dfr.columns:
+        er = enriched_cases(dfr)
+        areas = sorted(er["Practice Area"].dropna().unique()) if "Practice Area" in er.columns else []
+        sel_areas = st.multiselect("Practice Area (vazio = todas)", areas, key="rep_areas")
+        if st.button("Gerar relatórios (ZIP)"):
+            nums = er.loc[er["Practice Area"].isin(sel_areas), "Case Number"] if sel_areas else None
+            dfh = st.session_state.df_stages
+            if is_as_of() and has_history(dfh):
+                dfh = history_as_of(dfh, ref_date())
+            payloads = build_payloads(dfr, dfh, ref_date(), nums, enriched=er)
+            if not payloads:
+                st.info("Nenhum caso para os filtros escolhidos.")
+            else:
+                st.session_state.pop("_reports_zip", None)
+                bar = st.progress(0.0, text=f"Gerando {len(payloads)} relatórios…")
+                buf = io.BytesIO()
+                write_reports_zip(payloads, buf, on_progress=lambda n, tot: bar.progress(n/tot, text=f"{n}/{tot} relatórios"))
+                st.session_state["_reports_zip"] = buf.getvalue()
+        data = st.session_state.get("_reports_zip")
+        if data:
+            st.download_button("⬇️ Baixar relatórios (ZIP)", data=data, file_name="relatorios_casos.zip", mime="application/zip")
+    else:
+        st.caption("Carregue **Casos** com 'Case Number' para gerar os relatórios por cliente.")
 
-        fig, ax = plt.subplots(figsize=(10, max(3, 0.5*len(resumo))))
-        ax.barh(resumo["Practice Area"], resumo["media_tempo_conclusao"], color=ACCENT)
-        ax.invert_yaxis()
-        ax.set_xlabel("Dias (média ajustada)")
-        ax.set_title("Tempo médio de conclusão (ajustado) por Practice Area")
-        fig.patch.set_facecolor(BG_SOFT); ax.set_facecolor("#0B2C21")
-        st.pyplot(fig, clear_figure=True)
-
-        st.download_button(
-            "⬇️ Baixar estimativas por área (CSV)",
-            data=df_to_csv_bytes(resumo, include_index=False),
-            file_name="estimativas_conclusao_por_area.csv",
-            mime="text/csv"
-        )
-else:
-    st.caption("Carregue **Casos** com Open Date / Case Stage / Practice Area para a estimativa.")
+# =========================
+# PAINEL DE DESEMPENHO (sidebar, opcional)
+# =========================
+if debug:
+    with st.sidebar:
+        st.markdown("### 🛠️ Desempenho")
+        log = st.session_state._prof_log
+        last = profile_frame([r for r in log if r["rerun"] == st.session_state._prof_run])
+        st.caption(f"Rerun #{st.session_state._prof_run}")
+        st.dataframe(last[["secao","tempo_ms","linhas","mem_delta_mb"]], use_container_width=True, hide_index=True)
+        st.caption("Sessão (todas as execuções)")
+        st.dataframe(profile_summary(log), use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Tempos (CSV)", data=df_to_csv_bytes(profile_frame(log), include_index=False),
+                           file_name="panorama_tempos.csv", mime="text/csv")
+        st.download_button("⬇️ Tempos (JSON)", data=profile_json(log), file_name="panorama_tempos.json",
+                           mime="application/json")
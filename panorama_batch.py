@@ -0,0 +1,78 @@
+"""
+Modo batch (sem Streamlit): gera as tabelas do Panorama para um diretório de exportações de Casos.
+
+    python panorama_batch.py exports/ -o relatorios/ --workers 4
+
+Para cada arquivo CSV/XLS/XLSX do diretório, grava em <saida>/<nome do arquivo>/:
+  ativos_por_area.csv, dias_por_stage.csv, estimativas_conclusao_por_area.csv, metricas_por_caso.csv
+O mapeamento de colunas é o sugerido automaticamente (o mesmo ponto de partida do app).
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from panorama_core import (
+    CASES_FIELDS,
+    read_header, read_table_streaming, auto_mapping, normalize_mapped, enrich_cases,
+    active_by_area, stage_day_stats, completion_summary, case_metrics_table, df_to_csv_bytes,
+)
+
+EXPORT_SUFFIXES = (".csv", ".xls", ".xlsx")
+
+def build_reports(df_cases, hoje) -> dict:
+    """Tabelas de resumo de um dataset de Casos já normalizado: {nome do arquivo: DataFrame}."""
+    e = enrich_cases(df_cases, hoje)
+    cols = set(e.columns)
+    out = {}
+    if {"Practice Area", "Case Stage"} <= cols:
+        out["ativos_por_area.csv"] = active_by_area(e)
+    if "Case Stage" in cols:
+        out["dias_por_stage.csv"] = stage_day_stats(e)
+    if {"Open Date", "Case Stage", "Practice Area"} <= cols:
+        out["estimativas_conclusao_por_area.csv"] = completion_summary(e)
+    out["metricas_por_caso.csv"] = case_metrics_table(e, hoje)
+    return out
+
+def process_export(path: str, out_dir: str, hoje) -> tuple:
+    """Lê, normaliza e grava as tabelas de uma exportação. Retorna (arquivo, nº de casos, tabelas gravadas)."""
+    path = Path(path)
+    mapping = auto_mapping(read_header(path), CASES_FIELDS)
+    raw = read_table_streaming(path, usecols=[c for c in mapping.values() if c != "(não usar)"])
+    df_cases = normalize_mapped(raw, mapping)
+    dest = Path(out_dir) / path.stem
+    dest.mkdir(parents=True, exist_ok=True)
+    reports = build_reports(df_cases, hoje)
+    for fname, table in reports.items():
+        (dest / fname).write_bytes(df_to_csv_bytes(table, include_index=False))
+    return path.name, len(df_cases), sorted(reports)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Gera as tabelas do Panorama para um diretório de exportações de Casos.")
+    ap.add_argument("input_dir", help="diretório com as exportações (CSV/XLS/XLSX)")
+    ap.add_argument("-o", "--out", default="relatorios", help="diretório de saída (padrão: relatorios)")
+    ap.add_argument("-w", "--workers", type=int, default=None, help="processos em paralelo (padrão: nº de CPUs)")
+    ap.add_argument("--hoje", default=None, help="data de referência AAAA-MM-DD (padrão: hoje)")
+    args = ap.parse_args(argv)
+
+    hoje = datetime.strptime(args.hoje, "%Y-%m-%d").date() if args.hoje else datetime.now().date()
+    files = sorted(p for p in Path(args.input_dir).iterdir() if p.suffix.lower() in EXPORT_SUFFIXES)
+    if not files:
+        print(f"Nenhuma exportação encontrada em {args.input_dir}", file=sys.stderr)
+        return 1
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_export, str(p), args.out, hoje): p for p in files}
+        for fut in as_completed(futures):
+            try:
+                name, n, written = fut.result()
+                print(f"✔ {name}: {n} casos -> {', '.join(written)}")
+            except Exception as e:
+                failed += 1
+                print(f"✖ {futures[fut].name}: {e}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
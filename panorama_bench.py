@@ -0,0 +1,212 @@
+"""
+Benchmark do pipeline do Panorama com dados sintéticos.
+
+    python panorama_bench.py                       # 10k, 100k e 1M casos, CSV
+    python panorama_bench.py --sizes 10000 --format xlsx --json bench.json
+
+Gera arquivos de Casos e Histórico realistas (áreas de SOL_PRAZO, stages com "(N days)", datas dd/mm/aaaa)
+e mede cada etapa separadamente — leitura do arquivo (cabeçalho + streaming das colunas mapeadas),
+normalização do mapeamento, extração de stage, agregações (overview / dias por stage / estimativa)
+e renderização dos gráficos — com tempo de parede e pico de memória residente (RSS) por etapa.
+Use --json para guardar os números e comparar entre versões.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from panorama_core import (
+    CASES_FIELDS, STAGES_FIELDS, SOL_PRAZO,
+    read_header, read_table_streaming, auto_mapping, normalize_mapped, parse_stage_unique, enrich_cases,
+    active_by_area, stage_day_stats, completion_summary,
+)
+from panorama_charts import barh_png
+from panorama_profiling import rss_mb
+
+STAGE_NAMES = ["Intake", "Document Collection", "Drafting", "RFE Draft", "USCIS Pending Decision",
+               "Interview Scheduled", "Approved", "Case denied", "Closed"]
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+HIST_PER_CASE = 3
+HOJE = date(2025, 1, 1)
+RSS_SAMPLE_S = 0.002
+
+# =========================
+# DADOS SINTÉTICOS
+# =========================
+def _fmt_days(days: np.ndarray) -> pd.Series:
+    """Dias desde 1970 -> texto dd/mm/aaaa (vazio onde NaN)."""
+    d = pd.Series(pd.to_datetime(days, unit="D"))
+    return d.dt.strftime("%d/%m/%Y").fillna("")
+
+def synthetic_cases(n: int, seed: int = 0) -> pd.DataFrame:
+    """n casos no formato de exportação (colunas com os nomes originais do sistema)."""
+    rng = np.random.default_rng(seed)
+    areas = np.array(list(SOL_PRAZO))
+    area = areas[rng.integers(0, len(areas), n)]
+    prazo = pd.Series(area).map(SOL_PRAZO).to_numpy()
+    base = (pd.Timestamp(HOJE) - pd.Timestamp(0)).days
+    open_d = base - rng.integers(0, 4 * 365, n)
+    sol_d = open_d + prazo * rng.integers(1, 12, n)
+    closed = rng.random(n) < 0.3
+    closed_d = np.where(closed, open_d + rng.integers(30, 900, n), np.nan)
+    stage = np.array(STAGE_NAMES)[rng.integers(0, len(STAGE_NAMES), n)]
+    stage_txt = pd.Series(stage) + " (" + pd.Series(rng.integers(1, 400, n)).astype(str) + " days)"
+    return pd.DataFrame({
+        "Case": "Cliente " + pd.Series(np.arange(n)).astype(str),
+        "Case Number": np.arange(100_000, 100_000 + n),
+        "Practice Area": area,
+        "Case Stage": stage_txt,
+        "Open Date": _fmt_days(open_d),
+        "Closed Date": _fmt_days(closed_d),
+        "Statute of Limitations Date": _fmt_days(sol_d),
+    })
+
+def synthetic_history(cases: pd.DataFrame, per_case: int = HIST_PER_CASE, seed: int = 1) -> pd.DataFrame:
+    """Histórico de estágios: per_case intervalos consecutivos por caso (último em aberto)."""
+    rng = np.random.default_rng(seed)
+    n = len(cases) * per_case
+    case_no = np.repeat(cases["Case Number"].to_numpy(), per_case)
+    open_d = pd.to_datetime(cases["Open Date"], format="%d/%m/%Y").to_numpy().astype("datetime64[D]").astype("int64")
+    dur = rng.integers(1, 120, n).reshape(-1, per_case)
+    start = np.repeat(open_d, per_case).reshape(-1, per_case) + np.cumsum(dur, axis=1) - dur
+    end = (start + dur).astype(float)
+    end[:, -1] = np.nan
+    return pd.DataFrame({
+        "Case Number": case_no,
+        "Case Stage": np.array(STAGE_NAMES)[rng.integers(0, len(STAGE_NAMES), n)],
+        "Start Date": _fmt_days(start.ravel()),
+        "End Date": _fmt_days(end.ravel()),
+    })
+
+def write_export(df: pd.DataFrame, path: Path) -> Path:
+    if path.suffix == ".xlsx":
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+# =========================
+# MEDIÇÃO
+# =========================
+@contextmanager
+def timed(out: dict, stage: str):
+    t0 = time.perf_counter()
+    yield
+    out[stage] = time.perf_counter() - t0
+
+@contextmanager
+def sampled(out: dict, stage: str):
+    """
+    Pico do RSS do processo durante a etapa, acima do RSS no início dela (amostrado numa thread a cada
+    RSS_SAMPLE_S). Ao contrário do tracemalloc, enxerga os buffers do Arrow (texto no pandas 3) e do numpy.
+    """
+    base = rss_mb()
+    peak = [base]
+    done = threading.Event()
+    def sample():
+        while not done.wait(RSS_SAMPLE_S):
+            peak[0] = max(peak[0], rss_mb())
+    t = threading.Thread(target=sample, daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        done.set()
+        t.join()
+        out[stage] = max(peak[0], rss_mb()) - base
+
+def memory_pass(p_cases: Path, p_hist: Path, charts: bool = True) -> dict:
+    """Passada do pipeline medindo o RSS por etapa; roda num processo novo (ver run_size)."""
+    peak = {}
+    run_pipeline(p_cases, p_hist, lambda stage: sampled(peak, stage), charts)
+    return peak
+
+def run_pipeline(p_cases: Path, p_hist: Path, step, charts: bool = True) -> dict:
+    """Executa o pipeline do app etapa a etapa; step(etapa) envolve cada uma. Retorna {etapa: linhas}."""
+    rows = {}
+    # como no app: cabeçalho -> mapeamento sugerido -> leitura em streaming só das colunas mapeadas
+    with step("leitura Casos"):
+        map_c = auto_mapping(read_header(p_cases), CASES_FIELDS)
+        raw_c = read_table_streaming(p_cases, usecols=[c for c in map_c.values() if c != "(não usar)"])
+    with step("leitura Histórico"):
+        map_h = auto_mapping(read_header(p_hist), STAGES_FIELDS)
+        raw_h = read_table_streaming(p_hist, usecols=[c for c in map_h.values() if c != "(não usar)"])
+    rows.update({"leitura Casos": len(raw_c), "leitura Histórico": len(raw_h)})
+    with step("mapeamento Casos"):
+        df_c = normalize_mapped(raw_c, map_c)
+    with step("mapeamento Histórico"):
+        normalize_mapped(raw_h, map_h)
+    rows.update({"mapeamento Casos": len(raw_c), "mapeamento Histórico": len(raw_h)})
+    with step("extração de stage"):
+        parse_stage_unique(df_c["Case Stage"].astype(str))
+    with step("enriquecimento"):
+        e = enrich_cases(df_c, HOJE)
+    with step("overview (ativos)"):
+        ativos = active_by_area(e)
+    with step("dias por stage"):
+        stats = stage_day_stats(e)
+    with step("estimativa"):
+        resumo = completion_summary(e)
+    for k in ["extração de stage", "enriquecimento", "overview (ativos)", "dias por stage", "estimativa"]:
+        rows[k] = len(df_c)
+    if charts:
+        with step("gráficos"):
+            barh_png(ativos["Practice Area"], ativos["Casos Ativos"], "Ativos", "Casos", (10, 6))
+            barh_png(stats["Stage Clean"], stats["Média (dias)"], "Média por stage", "Dias", (10, 6))
+            barh_png(resumo["Practice Area"], resumo["media_tempo_conclusao"], "Conclusão", "Dias", (10, 6))
+        rows["gráficos"] = len(ativos) + len(stats) + len(resumo)
+    return rows
+
+def run_size(n: int, fmt: str, workdir: Path, charts: bool = True, mem: bool = True) -> list:
+    """
+    Gera os arquivos de n casos e mede o pipeline. O tempo vem de uma passada sem amostragem; o pico
+    de memória, de uma segunda passada num processo novo, para que o RSS de tamanhos anteriores (que o
+    alocador não devolve ao sistema) não esconda o desta.
+    """
+    cases = synthetic_cases(n)
+    hist = synthetic_history(cases)
+    p_cases = write_export(cases, workdir / f"casos_{n}.{fmt}")
+    p_hist = write_export(hist, workdir / f"historico_{n}.{fmt}")
+    del cases, hist
+
+    wall, peak = {}, {}
+    rows = run_pipeline(p_cases, p_hist, lambda stage: timed(wall, stage), charts)
+    if mem:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            peak = pool.submit(memory_pass, p_cases, p_hist, charts).result()
+    return [{"casos": n, "etapa": k, "linhas": rows[k], "tempo_s": round(wall[k], 4),
+             "pico_mb": round(peak[k], 2) if k in peak else None} for k in wall]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark do pipeline do Panorama com dados sintéticos.")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="nº de casos, separados por vírgula")
+    ap.add_argument("--format", choices=["csv", "xlsx"], default="csv", help="formato dos arquivos gerados")
+    ap.add_argument("--no-charts", action="store_true", help="não mede a renderização dos gráficos")
+    ap.add_argument("--no-mem", action="store_true", help="pula a passada de memória (só tempo)")
+    ap.add_argument("--json", default=None, help="grava os resultados neste arquivo JSON")
+    args = ap.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="panorama_bench_") as tmp:
+        for n in sizes:
+            results += run_size(n, args.format, Path(tmp), charts=not args.no_charts, mem=not args.no_mem)
+
+    table = pd.DataFrame(results)
+    print(table.to_string(index=False))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""Renderização dos gráficos do Panorama (matplotlib -> PNG), sem dependência do Streamlit."""
+import io
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+def barh_png(labels, values, title: str, xlabel: str, figsize, invert: bool = True,
+             color: str = "#9BE84F", fig_bg: str = "#0F4737", ax_bg: str = "#0B2C21") -> bytes:
+    """Barras horizontais (uma por rótulo, na ordem dada) renderizadas em PNG."""
+    fig, ax = plt.subplots(figsize=figsize)
+    y = list(range(len(labels)))
+    ax.barh(y, list(values), color=color)
+    ax.set_yticks(y)
+    ax.set_yticklabels(list(labels))
+    if invert:
+        ax.invert_yaxis()
+    ax.set_xlabel(xlabel)
+    ax.set_title(title)
+    fig.patch.set_facecolor(fig_bg); ax.set_facecolor(ax_bg)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=200, bbox_inches="tight", facecolor=fig.get_facecolor())
+    plt.close(fig)
+    return buf.getvalue()
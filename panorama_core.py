@@ -0,0 +1,959 @@
+"""
+Núcleo de cálculo do Panorama, sem dependência do Streamlit.
+
+Usado pelo app (app.py) e pelo modo batch (panorama_batch.py): leitura e normalização das
+exportações, parse de Case Stage, enriquecimento dos casos, as tabelas de resumo do portfólio
+e a atualização incremental contra o último snapshot (Parquet).
+"""
+import re
+from datetime import datetime, date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# HELPERS
+# =========================
+def as_date(val):
+    """Valor de uma coluna já normalizada (Timestamp/date/NaT) -> date ou None, sem re-parsear texto."""
+    if isinstance(val, datetime):
+        return None if pd.isna(val) else val.date()
+    if isinstance(val, date):
+        return val
+    return None
+
+def fmt_date(d):
+    return d.strftime("%d/%m/%Y") if isinstance(d, (datetime, date)) and not pd.isna(d) else "—"
+
+def safe_progress_value(percentual):
+    return max(0.0, min((percentual or 0.0)/100.0, 1.0))
+
+def df_to_csv_bytes(df: pd.DataFrame, include_index: bool = True) -> bytes:
+    return df.to_csv(index=include_index).encode("utf-8-sig")
+
+# =========================
+# LEITURA EM STREAMING (arquivos grandes)
+# XLSX pelo openpyxl em modo read_only (linha a linha, sem carregar estilos), CSV em chunks;
+# só as colunas pedidas e com limites de linhas / memória que falham antes de estourar a sessão.
+# =========================
+STREAM_CHUNK_ROWS = 50_000
+
+def _header_names(cells) -> list:
+    """Cabeçalho como o pandas monta: células vazias viram 'Unnamed: i' e repetidos ganham '.1', '.2'…"""
+    names, seen = [], {}
+    for i, v in enumerate(cells):
+        n = f"Unnamed: {i}" if v is None else v
+        if n in seen:
+            seen[n] += 1
+            n = f"{n}.{seen[n]}"
+        else:
+            seen[n] = 0
+        names.append(n)
+    return names
+
+def _rewind(src):
+    if hasattr(src, "seek"):
+        src.seek(0)
+
+def read_header(src, name: str = None) -> list:
+    """Só os nomes das colunas (primeira linha), sem ler o resto do arquivo."""
+    name = (name or str(src)).lower()
+    try:
+        if name.endswith(".xlsx"):
+            from openpyxl import load_workbook
+            wb = load_workbook(src, read_only=True, data_only=True)
+            try:
+                return _header_names(next(wb.worksheets[0].iter_rows(max_row=1, values_only=True), ()))
+            finally:
+                wb.close()
+        if name.endswith(".xls"):
+            return list(pd.read_excel(src, nrows=0).columns)
+        return list(pd.read_csv(src, nrows=0).columns)
+    finally:
+        _rewind(src)
+
+def _records_frame(rows: list, cols: list) -> pd.DataFrame:
+    """Bloco de linhas do openpyxl em DataFrame; colunas só com células vazias viram NaN (float), como no read_excel."""
+    df = pd.DataFrame.from_records(rows, columns=cols)
+    empty = [c for c in cols if df[c].dtype == object and df[c].isna().all()]
+    return df.astype({c: "float64" for c in empty}) if empty else df
+
+def _number_as_text(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return str(int(v)) if float(v).is_integer() else str(v)
+    return v
+
+def _unify_mixed(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    No XLSX cada bloco infere os tipos pelas próprias células: uma coluna com números em um bloco e
+    texto em outro chega misturada. Nessas colunas os números viram texto (datas e vazios ficam).
+    """
+    for c in df.columns:
+        if df[c].dtype != object:
+            continue
+        is_txt = df[c].dropna().map(lambda v: isinstance(v, str))
+        if is_txt.any() and not is_txt.all():
+            df[c] = df[c].map(_number_as_text, na_action="ignore")
+    return df
+
+def _xlsx_chunks(src, usecols, chunk_rows, max_rows):
+    """
+    (chunk, fração lida) de um XLSX em read_only. Só linhas totalmente vazias são puladas, para que
+    leituras de colunas diferentes do mesmo arquivo fiquem alinhadas linha a linha.
+    """
+    from openpyxl import load_workbook
+    wb = load_workbook(src, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total = (ws.max_row or 0) - 1
+        if max_rows and total > max_rows:   # a dimensão da planilha já diz o tamanho: falha antes de ler
+            raise ValueError(f"A planilha tem {total:,} linhas; o limite de leitura é {max_rows:,}.")
+        rows = ws.iter_rows(values_only=True)
+        header = _header_names(next(rows, ()))
+        idx = [i for i, c in enumerate(header) if usecols is None or c in usecols]
+        cols = [header[i] for i in idx]
+        buf, done = [], 0
+        for r in rows:
+            if all(v is None for v in r):
+                continue
+            buf.append(tuple(r[i] if i < len(r) else None for i in idx))
+            if len(buf) >= chunk_rows:
+                done += len(buf)
+                yield _records_frame(buf, cols), (done / total if total > 0 else None)
+                buf = []
+        if buf or not done:
+            yield _records_frame(buf, cols), 1.0
+    finally:
+        wb.close()
+
+def _csv_chunks(src, usecols, chunk_rows):
+    """
+    (chunk, fração lida) de um CSV via read_csv(chunksize); a fração vem da posição no arquivo.
+    Tudo é lido como texto: a inferência por chunk daria tipos diferentes para a mesma coluna
+    (e tiraria zeros à esquerda dos Case Numbers); a conversão fica com normalize_mapped.
+    """
+    fh = src if hasattr(src, "read") else open(src, "rb")
+    try:
+        size = fh.seek(0, 2)
+        fh.seek(0)
+        with pd.read_csv(fh, usecols=usecols, chunksize=chunk_rows, dtype=str) as reader:
+            for chunk in reader:
+                yield chunk, (min(fh.tell() / size, 1.0) if size else None)
+    finally:
+        if fh is not src:
+            fh.close()
+
+def read_table_streaming(src, name: str = None, usecols=None, chunk_rows: int = STREAM_CHUNK_ROWS,
+                         max_rows: int = None, max_mb: float = None, on_progress=None) -> pd.DataFrame:
+    """
+    Lê CSV/XLSX em blocos de chunk_rows linhas, só com as colunas em usecols (None = todas).
+    Passar de max_rows linhas ou de max_mb MB (memória dos blocos já lidos) gera ValueError com a
+    explicação, sem terminar a leitura. on_progress(linhas, fração ou None) é chamado a cada bloco.
+    XLS (formato antigo) não tem leitor em streaming: é lido inteiro, mas também passa pelos limites.
+    """
+    name = (name or str(src)).lower()
+    usecols = None if usecols is None else list(dict.fromkeys(usecols))
+    if name.endswith(".xlsx"):
+        chunks = _xlsx_chunks(src, usecols, chunk_rows, max_rows)
+    elif name.endswith(".xls"):
+        chunks = iter([(pd.read_excel(src, usecols=usecols), 1.0)])
+    else:
+        chunks = _csv_chunks(src, usecols, chunk_rows)
+    parts, rows, mb = [], 0, 0.0
+    for chunk, frac in chunks:
+        rows += len(chunk)
+        mb += chunk.memory_usage(index=False, deep=True).sum() / 1e6
+        if max_rows and rows > max_rows:
+            raise ValueError(f"O arquivo passa de {max_rows:,} linhas (limite de leitura); leitura interrompida.")
+        if max_mb and mb > max_mb:
+            raise ValueError(f"As colunas selecionadas passam de {max_mb:,g} MB em memória (limite de leitura) "
+                             f"após {rows:,} linhas; leitura interrompida.")
+        parts.append(chunk)
+        if on_progress:
+            on_progress(rows, frac)
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return _unify_mixed(df) if name.endswith(".xlsx") else df
+
+def extract_stage_label_and_days(stage_text: str):
+    """
+    Retorna (stage_sem_parenteses, dias:int) extraindo o último número dentro de parênteses.
+    Exemplos:
+      "USCIS Pending Decision (23 days)" -> ("USCIS Pending Decision", 23)
+      "Case denied (68 days)"            -> ("Case denied", 68)
+      "RFE Draft (14)"                   -> ("RFE Draft", 14)
+      "Stage (A) (7 days)"               -> ("Stage", 7)  # pega o último parêntese
+    """
+    if not isinstance(stage_text, str):
+        return "", 0
+
+    # pegue todos os trechos com parênteses e extraia o último número
+    matches = re.findall(r"\(([^()]*)\)", stage_text)  # conteúdo dentro de cada (...)
+    days_val = 0
+    if matches:
+        last = matches[-1]
+        # tente formato "68 days" ou apenas "68"
+        m_num = re.search(r"(\d+)\s*(?:days?|dias?)?", last, flags=re.IGNORECASE)
+        if m_num:
+            try:
+                days_val = int(m_num.group(1))
+            except Exception:
+                days_val = 0
+
+    # remove TODOS os parênteses do rótulo final
+    stage_clean = re.sub(r"\s*\([^)]*\)", "", stage_text).strip()
+    return stage_clean, days_val
+
+_STAGE_LAST_PAREN = r"(?s).*\(([^()]*)\)"
+_STAGE_ALL_PARENS = r"\s*\([^)]*\)"
+
+def parse_stage_series(stages: pd.Series) -> pd.DataFrame:
+    """
+    Versão vetorizada de extract_stage_label_and_days para uma coluna inteira.
+    Retorna DataFrame (mesmo índice) com "Stage Clean" e "Stage Days" — resultados idênticos
+    à função por linha (último parêntese, sufixos days/dias, não-texto -> ("", 0)).
+    """
+    is_txt = stages.map(lambda v: isinstance(v, str)).astype(bool)
+    txt = stages.where(is_txt, "").astype(object)
+    last = txt.str.extract(_STAGE_LAST_PAREN, expand=False)   # conteúdo do último (...)
+    num = last.str.extract(r"(\d+)", expand=False)            # primeiro número dentro dele
+    days = num.map(lambda n: int(n) if isinstance(n, str) else 0).astype("int64")
+    clean = txt.str.replace(_STAGE_ALL_PARENS, "", regex=True).str.strip()
+    return pd.DataFrame({"Stage Clean": clean.where(is_txt, "").astype(object), "Stage Days": days},
+                        index=stages.index)
+
+def parse_stage_unique(stages: pd.Series) -> pd.DataFrame:
+    """parse_stage_series aplicado só aos valores distintos (poucos stages, muitas linhas)."""
+    codes, uniq = pd.factorize(stages)
+    parsed = parse_stage_series(pd.Series(np.asarray(uniq, dtype=object)))
+    parsed = pd.concat([parsed, pd.DataFrame({"Stage Clean": [""], "Stage Days": [0]})], ignore_index=True)
+    out = parsed.iloc[codes].set_axis(stages.index)   # código -1 (NA) cai na última linha: ("", 0)
+    return out.astype({"Stage Days": "int64"})
+
+# Prazos SOL por área (se precisar em outras telas)
+SOL_PRAZO = {
+    "FOIA": 30, "I-130": 30, "COS": 30, "B2-EXT": 30, "NPT": 60, "NVC": 60, "K1": 30,
+    "WAIVER": 90, "EB2-NIW": 120, "EB1": 90, "E2": 90, "O1": 90, "EB4": 90,
+    "AOS": 60, "ROC": 60, "NATZ": 30, "DA": 90, "PIP": 30, "I-90": 30, "COURT": 60,
+    "DOM": 30, "SIJS": 30, "VAWA": 90, "T-VISA": 120, "U-VISA": 90, "I-918B": 30,
+    "ASYLUM": 120, "PERM": 30, "EB3": 30
+}
+
+# =========================
+# ENRIQUECIMENTO (uma vez por dataset)
+# Todas as seções agregam a partir deste frame em vez de copiar/derivar df_cases.
+# =========================
+STAGES_FINAIS = ("APPROVED", "DENIED", "CLOSED")
+
+def to_days(col: pd.Series) -> np.ndarray:
+    """Coluna de datas (date/str/datetime) -> array datetime64[D]; inválidas viram NaT."""
+    return pd.to_datetime(col, errors="coerce", dayfirst=True).to_numpy().astype("datetime64[D]")
+
+def completion_and_overrun(open_d, sol_d, stage_clean: pd.Series, stage_days, hoje: date):
+    """
+    Estimativa colunar (arrays datetime64[D]):
+      - total = max(0, HOJE − Open Date); NaN sem Open Date
+      - "USCIS Pending Decision" no stage -> subtrai Stage Days (mín. 0)
+      - SOL overrun = max(0, HOJE − SOL); 0 sem SOL
+    """
+    hoje64 = np.datetime64(hoje, "D")
+    one_day = np.timedelta64(1, "D")
+    total = np.maximum((hoje64 - open_d) / one_day, 0)                  # NaN onde Open Date é NaT
+    pending = stage_clean.str.upper().str.contains("USCIS PENDING DECISION", regex=False).to_numpy(dtype=bool)
+    adj = np.where(pending, np.maximum(total - np.asarray(stage_days), 0), total)
+    if sol_d is None:
+        over = np.zeros(len(adj))
+    else:
+        over = np.nan_to_num(np.maximum((hoje64 - sol_d) / one_day, 0), nan=0.0)
+    over = np.where(np.isnan(adj), np.nan, over)
+    return adj, over
+
+def enrich_static(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parte do enriquecimento que não depende da data de referência: Practice Area sem espaços,
+    datas em datetime64, Stage Clean/Stage Days e Ativo (pelo Case Stage).
+    """
+    keep = [c for c in ["Case Number","Practice Area","Case Stage","Open Date","Closed Date","Statute of Limitations Date"]
+            if c in df.columns]
+    e = df[keep].copy()
+    if "Practice Area" in e.columns:
+        e["Practice Area"] = e["Practice Area"].astype(str).str.strip()
+    for dc in ["Open Date","Closed Date","Statute of Limitations Date"]:
+        if dc in e.columns:
+            e[dc] = to_days(e[dc])
+    if "Case Stage" in e.columns:
+        stage_txt = e["Case Stage"].astype(str)
+        parsed = parse_stage_unique(stage_txt)
+        e["Stage Clean"] = parsed["Stage Clean"]
+        e["Stage Days"]  = parsed["Stage Days"]
+        e["Ativo"] = ~stage_txt.str.upper().str.contains("|".join(STAGES_FINAIS), regex=True, na=False)
+    return e
+
+def at_reference_date(static: pd.DataFrame, hoje: date, as_of: bool = False) -> pd.DataFrame:
+    """
+    Completa o frame de enrich_static para a data de referência `hoje` (AdjCompletionDays, SOL_OverrunDays).
+    Com as_of=True a data é uma data passada: só entram casos abertos até ela, e casos com Closed Date
+    posterior contam como ativos naquela data (sem Closed Date, vale a regra do Case Stage).
+    """
+    e = static
+    if as_of and "Open Date" in e.columns:
+        ref = np.datetime64(hoje, "D")
+        e = e[e["Open Date"].to_numpy("datetime64[D]") <= ref].copy()
+        if "Closed Date" in e.columns and "Ativo" in e.columns:
+            closed = e["Closed Date"].to_numpy("datetime64[D]")
+            e["Ativo"] = np.where(np.isnat(closed), e["Ativo"].to_numpy(), closed > ref)
+    else:
+        e = e.copy()
+    if "Case Stage" in e.columns and "Open Date" in e.columns:
+        sol = e["Statute of Limitations Date"].to_numpy() if "Statute of Limitations Date" in e.columns else None
+        adj, over = completion_and_overrun(e["Open Date"].to_numpy(), sol, e["Stage Clean"], e["Stage Days"], hoje)
+        e["AdjCompletionDays"] = pd.Series(adj, index=e.index).astype("Int64")
+        e["SOL_OverrunDays"]   = pd.Series(over, index=e.index).astype("Int64")
+    return e
+
+def enrich_cases(df: pd.DataFrame, hoje: date, as_of: bool = False) -> pd.DataFrame:
+    """
+    Colunas derivadas de Casos: Practice Area sem espaços, datas em datetime64, Stage Clean/Stage Days,
+    Ativo, AdjCompletionDays e SOL_OverrunDays (NA quando não há Open Date).
+    """
+    return at_reference_date(enrich_static(df), hoje, as_of)
+
+def completion_summary(enriched: pd.DataFrame) -> pd.DataFrame:
+    """Tabela 'resumo' da Estimativa por Practice Area (vazia se nenhum caso tem Open Date)."""
+    est = enriched.loc[enriched["AdjCompletionDays"].notna(), ["Practice Area","AdjCompletionDays","SOL_OverrunDays"]]
+    est = est.astype({"AdjCompletionDays": "int64", "SOL_OverrunDays": "int64"})
+    est["Practice Area"] = est["Practice Area"].replace("", "(sem área)")
+    est["ultrapassado"] = est["SOL_OverrunDays"].gt(0)
+    resumo = est.groupby("Practice Area").agg(
+        casos=("AdjCompletionDays","count"),
+        media_tempo_conclusao=("AdjCompletionDays","mean"),
+        media_sol_ultrapasso=("SOL_OverrunDays","mean"),
+        pct_ultrapassados=("ultrapassado","mean"),
+    )
+    resumo["pct_ultrapassados"] = 100.0 * resumo["pct_ultrapassados"]
+    return resumo.round(1).sort_values("media_tempo_conclusao", ascending=False).reset_index()
+
+def active_by_area(enriched: pd.DataFrame) -> pd.DataFrame:
+    """Casos ativos por Practice Area (Overview do Departamento)."""
+    return enriched.groupby("Practice Area")["Ativo"].sum().sort_values(ascending=False).reset_index(name="Casos Ativos")
+
+def stage_day_stats(enriched: pd.DataFrame) -> pd.DataFrame:
+    """Estatísticas de dias entre '()' por Stage Clean (vazio se nenhum stage tem dias)."""
+    tmp = enriched[(enriched["Stage Clean"].astype(str).str.strip() != "") & (enriched["Stage Days"] > 0)]
+    stats = tmp.groupby("Stage Clean")["Stage Days"].agg(["count","mean","median","max"]).round(1).sort_values("mean", ascending=False).reset_index()
+    return stats.rename(columns={"count":"#Casos", "mean":"Média (dias)", "median":"Mediana", "max":"Máx"})
+
+# =========================
+# MÉTRICAS POR CASO
+# =========================
+def case_metrics(open_date, sol_date, stage_clean, stage_days, hoje: date) -> dict:
+    """Métricas do painel do cliente (tempo do processo, dias desde Open Date, SOL)."""
+    base_days = max(0, (hoje - open_date).days) if open_date else 0
+    # Regra: só SUBTRAI os dias entre () se USCIS Pending Decision
+    if "USCIS PENDING DECISION" in (stage_clean or "").upper():
+        tempo_processo = max(0, base_days - stage_days)
+    else:
+        tempo_processo = base_days
+    # Progresso vs SOL (informativo)
+    if open_date and sol_date:
+        tot = (sol_date - open_date).days
+        dec = (hoje - open_date).days
+        rest = (sol_date - hoje).days
+        perc = round((dec/tot)*100,2) if tot>0 else (100.0 if hoje>=sol_date else 0.0)
+    else:
+        tot=dec=rest=0; perc=0.0
+    return {"tempo_processo": tempo_processo, "dias_desde_open": base_days,
+            "dias_ate_sol": rest, "progresso_sol": perc}
+
+def case_metrics_table(enriched: pd.DataFrame, hoje: date) -> pd.DataFrame:
+    """case_metrics para todos os casos de uma vez (mesmas regras, em arrays datetime64[D])."""
+    hoje64 = np.datetime64(hoje, "D")
+    one_day = np.timedelta64(1, "D")
+    od = enriched["Open Date"].to_numpy("datetime64[D]") if "Open Date" in enriched.columns else np.full(len(enriched), np.datetime64("NaT", "D"))
+    sol = (enriched["Statute of Limitations Date"].to_numpy("datetime64[D]")
+           if "Statute of Limitations Date" in enriched.columns else np.full(len(enriched), np.datetime64("NaT", "D")))
+    has_both = ~np.isnat(od) & ~np.isnat(sol)
+    tot = (sol - od) / one_day
+    dec = (hoje64 - od) / one_day
+    rest = (sol - hoje64) / one_day
+    with np.errstate(divide="ignore", invalid="ignore"):
+        perc = np.where(tot > 0, np.round(dec / tot * 100, 2), np.where(hoje64 >= sol, 100.0, 0.0))
+    out = pd.DataFrame(index=enriched.index)
+    for c in ["Case Number","Practice Area","Stage Clean"]:
+        if c in enriched.columns:
+            out[c] = enriched[c]
+    adj = enriched["AdjCompletionDays"] if "AdjCompletionDays" in enriched.columns else pd.Series(0, index=enriched.index)
+    out["tempo_processo"] = adj.fillna(0).astype("int64")
+    out["dias_desde_open"] = np.nan_to_num(np.maximum(dec, 0), nan=0).astype("int64")
+    out["dias_ate_sol"] = np.where(has_both, rest, 0).astype("int64")
+    out["progresso_sol"] = np.where(has_both, perc, 0.0)
+    return out
+
+def stage_durations(hist: pd.DataFrame, hoje: date) -> pd.Series:
+    """Dias em cada stage (Start→End; End vazio = hoje; datas inválidas ou invertidas = 0)."""
+    start = to_days(hist["Start Date"])
+    end   = to_days(hist["End Date"])
+    end   = np.where(np.isnat(end), np.datetime64(hoje, "D"), end)
+    dias  = (end - start) / np.timedelta64(1, "D")
+    return pd.Series(np.where(np.isnan(dias) | (dias < 0), 0, dias).astype(int), index=hist.index)
+
+# =========================
+# ANÁLISE DE ESTÁGIOS (HISTÓRICO COMPLETO)
+# Durações medidas Start→End de todos os intervalos + transições stage -> próximo stage.
+# =========================
+def stage_intervals(df_stages: pd.DataFrame, hoje: date) -> pd.DataFrame:
+    """
+    Um intervalo por linha do histórico, ordenado por Start Date, com Stage (sem '()'), Dias medidos,
+    em_aberto (End vazio -> medido até hoje) e o Próximo Stage do mesmo caso (groupby/shift). Linhas sem
+    Start Date ficam no resultado, mas fora da sequência: não têm posição conhecida, então não têm
+    Próximo Stage nem contam como próximo de outra linha.
+    """
+    start = to_days(df_stages["Start Date"])
+    order = np.argsort(start, kind="stable")            # NaT vai para o fim
+    h = df_stages.iloc[order]
+    end = to_days(h["End Date"])
+    iv = pd.DataFrame({
+        "Case Number": h["Case Number"].astype(str).to_numpy(),
+        "Stage": parse_stage_unique(h["Case Stage"].astype(str))["Stage Clean"].to_numpy(),
+        "Start Date": start[order],
+        "End Date": end,
+        "Dias": stage_durations(h, hoje).to_numpy(),
+        "em_aberto": np.isnat(end),
+    })
+    dated = iv[~np.isnat(iv["Start Date"].to_numpy())]
+    iv["Próximo Stage"] = dated.groupby("Case Number", sort=False)["Stage"].shift(-1)
+    return iv
+
+def _dwell_agg(g) -> pd.DataFrame:
+    return g.agg(**{"#Intervalos": "count", "Média (dias)": "mean", "Mediana": "median",
+                    "P90": lambda d: d.quantile(0.9), "Máx": "max"})
+
+def measured_stage_stats(intervals: pd.DataFrame) -> pd.DataFrame:
+    """Permanência medida por stage, só com intervalos fechados e datados (abertos ainda estão correndo)."""
+    done = intervals[~intervals["em_aberto"] & ~np.isnat(intervals["Start Date"].to_numpy()) & (intervals["Stage"] != "")]
+    stats = _dwell_agg(done.groupby("Stage")["Dias"]).round(1)
+    return stats.sort_values("Média (dias)", ascending=False).reset_index()
+
+def stage_transitions(intervals: pd.DataFrame) -> pd.DataFrame:
+    """Pares stage -> próximo stage: contagem e permanência (mediana/P90) no stage de origem."""
+    t = intervals.dropna(subset=["Próximo Stage"])
+    out = _dwell_agg(t.groupby(["Stage", "Próximo Stage"])["Dias"]).round(1)
+    return out.sort_values("#Intervalos", ascending=False).reset_index()
+
+def transition_matrix(transitions: pd.DataFrame) -> pd.DataFrame:
+    """Matriz de contagens (linhas = stage de origem, colunas = próximo stage)."""
+    return transitions.pivot_table(index="Stage", columns="Próximo Stage", values="#Intervalos",
+                                   aggfunc="sum", fill_value=0)
+
+def history_as_of(df_stages: pd.DataFrame, ref: date) -> pd.DataFrame:
+    """Histórico como estava em `ref`: sem intervalos iniciados depois; os que fecharam depois ficam em aberto."""
+    ref64 = np.datetime64(ref, "D")
+    start = to_days(df_stages["Start Date"])
+    h = df_stages[~(start > ref64)].copy()
+    end = to_days(h["End Date"])
+    h["End Date"] = pd.Series(np.where(end > ref64, np.datetime64("NaT", "D"), end), index=h.index).astype("datetime64[s]")
+    return h
+
+# =========================
+# BACKLOG AO LONGO DO TEMPO
+# Sweep-line: +1 no Open Date, −1 no Closed Date, soma acumulada por dia e Practice Area.
+# =========================
+def backlog_series(static: pd.DataFrame, freq: str = "D", end: date = None) -> pd.DataFrame:
+    """
+    Casos ativos por Practice Area em cada dia (freq="D") ou no fim de cada semana (freq="W").
+    Ativo no dia d: Open Date <= d < Closed Date. Casos sem Open Date, ou com Closed Date anterior
+    ao Open Date, ficam de fora.
+    """
+    od = static["Open Date"].to_numpy("datetime64[D]")
+    cd = (static["Closed Date"].to_numpy("datetime64[D]") if "Closed Date" in static.columns
+          else np.full(len(static), np.datetime64("NaT", "D")))
+    area = static["Practice Area"].to_numpy() if "Practice Area" in static.columns else np.full(len(static), "(sem área)")
+    ok = ~np.isnat(od) & ~(cd < od)
+    closes = ok & ~np.isnat(cd)
+    ev = pd.DataFrame({
+        "data": np.concatenate([od[ok], cd[closes]]),
+        "area": np.concatenate([area[ok], area[closes]]),
+        "delta": np.concatenate([np.ones(ok.sum(), dtype="int64"), -np.ones(closes.sum(), dtype="int64")]),
+    })
+    if ev.empty:
+        return pd.DataFrame()
+    daily = ev.groupby(["data", "area"])["delta"].sum().unstack(fill_value=0).sort_index()
+    last = max(daily.index.max(), pd.Timestamp(end)) if end else daily.index.max()
+    daily = daily.reindex(pd.date_range(daily.index.min(), last, freq="D"), fill_value=0).cumsum()
+    if freq == "W":
+        daily = daily.resample("W").last()
+    daily.index.name = "Data"
+    return daily
+
+# =========================
+# PRAZOS SOL (PORTFÓLIO)
+# Índice ordenado de datas SOL; consultas "vence em N dias" / "ultrapassado" por busca binária.
+# =========================
+def infer_sol(enriched: pd.DataFrame) -> tuple:
+    """
+    (SOL datetime64[D], inferida: bool) por caso. Onde a coluna SOL falta ou está vazia,
+    usa Open Date + SOL_PRAZO[Practice Area] (vetorizado).
+    """
+    n = len(enriched)
+    if "Statute of Limitations Date" in enriched.columns:
+        sol = enriched["Statute of Limitations Date"].to_numpy("datetime64[D]")
+    else:
+        sol = np.full(n, np.datetime64("NaT", "D"))
+    inferred = np.zeros(n, dtype=bool)
+    if "Open Date" in enriched.columns and "Practice Area" in enriched.columns:
+        prazo = enriched["Practice Area"].astype(str).str.strip().str.upper().map(SOL_PRAZO).to_numpy(dtype=float)
+        od = enriched["Open Date"].to_numpy("datetime64[D]")
+        inferred = np.isnat(sol) & ~np.isnat(od) & ~np.isnan(prazo)
+        sol = sol.copy()
+        sol[inferred] = od[inferred] + prazo[inferred].astype("int64").astype("timedelta64[D]")
+    return sol, inferred
+
+def build_sol_index(enriched: pd.DataFrame, only_active: bool = True) -> tuple:
+    """
+    (SOLs ordenadas, posições no frame na mesma ordem, SOL por posição, inferida por posição).
+    Casos sem SOL (nem inferível) — e, com only_active, os encerrados — ficam fora das consultas.
+    """
+    sol, inferred = infer_sol(enriched)
+    keep = ~np.isnat(sol)
+    if only_active and "Ativo" in enriched.columns:
+        keep &= enriched["Ativo"].to_numpy(dtype=bool)
+    pos = np.flatnonzero(keep)
+    order = np.argsort(sol[pos], kind="stable")
+    return sol[pos][order], pos[order], sol, inferred
+
+def sol_due_within(index: tuple, hoje: date, days: int) -> np.ndarray:
+    """Posições dos casos com HOJE <= SOL <= HOJE + days, ordenadas pela SOL."""
+    sol_sorted, pos = index[0], index[1]
+    hoje64 = np.datetime64(hoje, "D")
+    lo = np.searchsorted(sol_sorted, hoje64, side="left")
+    hi = np.searchsorted(sol_sorted, hoje64 + np.timedelta64(days, "D"), side="right")
+    return pos[lo:hi]
+
+def sol_overrun(index: tuple, hoje: date) -> np.ndarray:
+    """Posições dos casos com SOL já ultrapassada (SOL < HOJE), da mais antiga para a mais recente."""
+    sol_sorted, pos = index[0], index[1]
+    return pos[: np.searchsorted(sol_sorted, np.datetime64(hoje, "D"), side="left")]
+
+def sol_table(enriched: pd.DataFrame, index: tuple, positions: np.ndarray, hoje: date) -> pd.DataFrame:
+    """Linhas do resultado de uma consulta SOL, prontas para exibir/exportar."""
+    sol = index[2][positions]
+    sub = enriched.iloc[positions]
+    out = pd.DataFrame(index=sub.index)
+    for c in ["Case Number","Practice Area","Stage Clean"]:
+        if c in sub.columns:
+            out[c] = sub[c]
+    out["SOL"] = pd.Series(sol, index=sub.index, dtype="datetime64[s]").dt.date
+    out["dias_ate_sol"] = ((sol - np.datetime64(hoje, "D")) / np.timedelta64(1, "D")).astype("int64")
+    out["sol_inferida"] = index[3][positions]
+    return out.reset_index(drop=True)
+
+# =========================
+# ÍNDICES POR CASE NUMBER
+# =========================
+def build_case_index(df: pd.DataFrame) -> dict:
+    """Case Number (str) -> posição da primeira linha; a ordem das chaves é a de aparição."""
+    cn = df["Case Number"]
+    valid = cn.notna().to_numpy()
+    keys = cn[valid].astype(str)
+    first = ~keys.duplicated().to_numpy()
+    return dict(zip(keys.to_numpy()[first], np.flatnonzero(valid)[first]))
+
+def build_stage_index(df: pd.DataFrame):
+    """(histórico ordenado por Start Date, {Case Number (str) -> posições nesse frame})."""
+    start = pd.to_datetime(df["Start Date"], errors="coerce", dayfirst=True)
+    ordered = df.iloc[np.argsort(start.to_numpy(), kind="stable")]   # NaT vai para o fim
+    keys = ordered["Case Number"].astype(str).to_numpy()
+    return ordered, pd.Series(np.arange(len(keys))).groupby(keys, sort=False).indices
+
+# =========================
+# MAPEAMENTO
+# =========================
+CASES_FIELDS = {
+    "Case": ["Case","Caso","Cliente","Assunto"],
+    "Case Number": ["Case Number","Número do Caso","CaseNo","Case_ID","ID"],
+    "Practice Area": ["Practice Area","Área","Area","Tipo de Visto","Visto"],
+    "Case Stage": ["Case Stage","Stage","Status","Fase","Etapa"],
+    "Open Date": ["Open Date","Data de Abertura","Start Date","Início"],
+    "Closed Date": ["Closed Date","Data de Fechamento","End Date","Fechado em"],
+    "Statute of Limitations Date": ["Statute of Limitations Date","SOL","SOL Date","Prazo SOL","Limitation Date"],
+}
+
+STAGES_FIELDS = {
+    "Case Number": ["Case Number","Número do Caso","CaseNo","ID"],
+    "Case Stage": ["Case Stage","Stage","Status","Fase","Etapa"],
+    "Start Date": ["Start Date","Início","Data Inicial","Start"],
+    "End Date": ["End Date","Fim","Data Final","End"],
+}
+
+def suggest_mapping(df_cols, synonyms):
+    norm = {c: c.strip().lower() for c in df_cols if isinstance(c, str)}
+    for syn in synonyms:
+        s = syn.strip().lower()
+        for c, cl in norm.items():
+            if cl == s:
+                return c
+    for syn in synonyms:
+        s = syn.strip().lower()
+        for c, cl in norm.items():
+            if s in cl:
+                return c
+    return None
+
+DATE_COLS = ["Open Date","Closed Date","Statute of Limitations Date","Start Date","End Date"]
+CATEGORY_COLS = ["Practice Area","Case Stage"]
+
+# Formatos testados na amostra, em ordem de preferência (dd/mm antes de ISO, como no dayfirst=True)
+DATE_FORMATS = ["%d/%m/%Y", "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S",
+                "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y"]
+EXCEL_ORIGIN = "1899-12-30"
+EXCEL_SERIAL_RANGE = (1, 73415)   # 01/01/1900 a 31/12/2100; fora disso o número não é data serial
+DATE_SAMPLE = 500
+
+def _serials(col: pd.Series) -> pd.Series:
+    """Números seriais do Excel da coluna; fora de EXCEL_SERIAL_RANGE (ou não numéricos) viram NaN."""
+    num = pd.to_numeric(col, errors="coerce")
+    return num.where(num.between(*EXCEL_SERIAL_RANGE))
+
+def _digit_dates(txt: pd.Series) -> str:
+    """Formato de texto só com dígitos: "%Y%m%d" quando parece aaaammdd, senão "excel" (serial)."""
+    if txt.str.fullmatch(r"\d{8}").all() and pd.to_datetime(txt, format="%Y%m%d", errors="coerce").notna().mean() >= 0.9:
+        return "%Y%m%d"
+    return "excel"
+
+def _date_text(col: pd.Series) -> pd.Series:
+    """Coluna como texto sem espaços; números inteiros sem o ".0" (ex.: 20240115 vindo do Excel)."""
+    if pd.api.types.is_numeric_dtype(col) and (col.dropna() % 1 == 0).all():
+        col = col.astype("Int64")
+    return col.astype(str).str.strip()
+
+def infer_date_format(col: pd.Series):
+    """
+    Olha uma amostra da coluna e devolve "datetime" (já são datas), "excel" (número serial do Excel),
+    um formato strftime explícito, ou None (sem padrão dominante -> parse genérico dayfirst).
+    Inteiros de 8 dígitos são testados antes como aaaammdd; seriais do Excel fora de EXCEL_SERIAL_RANGE
+    viram falha no parse.
+    """
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return "datetime"
+    vals = col.dropna()
+    if vals.empty:
+        return None
+    sample = vals.iloc[:: max(1, len(vals) // DATE_SAMPLE)].head(DATE_SAMPLE)
+    if pd.api.types.is_numeric_dtype(col):
+        return _digit_dates(_date_text(sample)) if (sample % 1 == 0).all() else "excel"
+    if sample.map(lambda v: isinstance(v, (datetime, date))).all():
+        return "datetime"
+    txt = sample.astype(str).str.strip()
+    txt = txt[txt != ""]
+    if txt.empty:
+        return None
+    if txt.str.fullmatch(r"\d+").all():
+        return _digit_dates(txt)
+    if txt.str.fullmatch(r"\d+\.\d+").all():
+        return "excel"
+    best, best_ok = None, 0.0
+    for fmt in DATE_FORMATS:
+        ok = pd.to_datetime(txt, format=fmt, errors="coerce").notna().mean()
+        if ok > best_ok:
+            best, best_ok = fmt, ok
+        if ok == 1.0:
+            break
+    return best if best_ok >= 0.9 else None
+
+def parse_date_column(col: pd.Series):
+    """
+    Converte a coluna uma única vez com o formato inferido. Linhas que não batem com o formato
+    (inclusive texto digitado numa coluna de datas do Excel) passam pelo parse genérico (dayfirst);
+    as que ainda falham são sinalizadas.
+    Retorna (Series datetime64, formato, posições das linhas com falha, nº de linhas do parse genérico).
+    """
+    fmt = infer_date_format(col)
+    if fmt == "datetime" and not pd.api.types.is_datetime64_any_dtype(col):
+        # só as células que já são datas; o resto (texto) segue para o parse dayfirst abaixo
+        is_dt = col.map(lambda v: isinstance(v, (datetime, date)), na_action="ignore").fillna(False).astype(bool)
+        d = pd.to_datetime(col.where(is_dt), errors="coerce")
+    elif fmt == "datetime":
+        d = pd.to_datetime(col, errors="coerce")
+    elif fmt == "excel":
+        d = pd.to_datetime(_serials(col), unit="D", origin=EXCEL_ORIGIN, errors="coerce")
+    elif fmt is None:
+        d = pd.to_datetime(col, errors="coerce", dayfirst=True)
+    else:
+        d = pd.to_datetime(_date_text(col), format=fmt, errors="coerce")
+    filled = col.notna() & (col.astype(str).str.strip() != "")
+    miss = filled & d.isna()
+    generic = 0
+    if miss.any() and fmt != "excel":
+        d = d.copy()
+        d[miss] = pd.to_datetime(col[miss].astype(str).str.strip(), errors="coerce", dayfirst=True)
+        generic = int((miss & d.notna()).sum())
+        miss = filled & d.isna()
+    return d, fmt, np.flatnonzero(miss.to_numpy()), generic
+
+def compact_case_number(col: pd.Series) -> pd.Series:
+    """
+    Case Number como inteiro quando a coluna é numérica e inteira, ou texto só com dígitos sem zero à
+    esquerda (CSV lido como texto); senão categórico (preserva zeros à esquerda e IDs como "X-150000").
+    """
+    if not pd.api.types.is_numeric_dtype(col):
+        txt = col.dropna().astype(str)
+        if len(txt) and txt.str.fullmatch(r"0|[1-9]\d{0,17}").all():
+            col = pd.to_numeric(col)
+    if pd.api.types.is_numeric_dtype(col) and (col.dropna() % 1 == 0).all():
+        num = col
+        if num.isna().any():
+            return num.astype("Int64")
+        return pd.to_numeric(num.astype("int64"), downcast="integer")
+    return col.astype("category")
+
+def normalize_mapped(df, mapping, compact=True):
+    """
+    Aplica o mapeamento escolhido: renomeia, faz trim e converte as datas.
+    compact=True guarda datas como datetime64 (em vez de objetos date), Practice Area / Case Stage
+    como categóricos e Case Number como inteiro/categórico.
+    """
+    rename = {v: k for k, v in mapping.items() if v != "(não usar)"}
+    df2 = df.rename(columns=rename).copy()
+    # trim
+    for c in df2.columns:
+        if isinstance(c, str):
+            df2[c] = df2[c].apply(lambda x: x.strip() if isinstance(x, str) else x)
+    # datas: formato inferido por coluna, parse único; falhas ficam em df2.attrs["date_report"]
+    report = {}
+    for dc in DATE_COLS:
+        if dc in df2.columns:
+            d, fmt, failed, generic = parse_date_column(df2[dc])
+            df2[dc] = d.astype("datetime64[s]") if compact else d.dt.date
+            report[dc] = {"formato": fmt or "(genérico)", "falhas": len(failed), "linhas": failed[:20].tolist(),
+                          "dayfirst": generic}
+    df2.attrs["date_report"] = report
+    if compact:
+        for cc in CATEGORY_COLS:
+            if cc in df2.columns:
+                df2[cc] = df2[cc].astype("category")
+        if "Case Number" in df2.columns:
+            df2["Case Number"] = compact_case_number(df2["Case Number"])
+    return df2
+
+def auto_mapping(cols, expected_dict) -> dict:
+    """Mapeamento sugerido (sem UI) — o mesmo ponto de partida que o mapping_ui mostra."""
+    return {k: suggest_mapping(cols, syn) or "(não usar)" for k, syn in expected_dict.items()}
+
+def memory_report(raw: pd.DataFrame, norm: pd.DataFrame, mapping) -> pd.DataFrame:
+    """Memória por coluna (MB) do arquivo bruto vs. frame normalizado."""
+    back = {k: v for k, v in mapping.items() if v != "(não usar)"}
+    rows = []
+    for c in norm.columns:
+        src = back.get(c, c)
+        before = raw[src].memory_usage(index=False, deep=True) if src in raw.columns else 0
+        after = norm[c].memory_usage(index=False, deep=True)
+        rows.append({"Coluna": c, "Antes (MB)": before/1e6, "Depois (MB)": after/1e6, "dtype": str(norm[c].dtype)})
+    rep = pd.DataFrame(rows)
+    total = {"Coluna": "TOTAL", "Antes (MB)": rep["Antes (MB)"].sum(), "Depois (MB)": rep["Depois (MB)"].sum(), "dtype": ""}
+    return pd.concat([rep, pd.DataFrame([total])], ignore_index=True).round(3)
+
+# =========================
+# CONSOLIDAÇÃO DE VÁRIAS EXPORTAÇÕES (um arquivo por escritório)
+# Cada arquivo é normalizado com o seu próprio mapeamento; aqui só se junta e remove repetidos.
+# =========================
+def _case_number_text(col: pd.Series) -> pd.Series:
+    """Case Number como texto; inteiros sem o ".0" que o float (ex.: coluna com vazios) acrescentaria."""
+    if pd.api.types.is_numeric_dtype(col) and (col.dropna() % 1 == 0).all():
+        col = col.astype("Int64")
+    return col.astype("string")
+
+def concat_exports(frames: list, compact: bool = True) -> pd.DataFrame:
+    """
+    Empilha frames normalizados com a coluna _arquivo (posição na lista); compact refaz os categóricos.
+    Se algum arquivo tem Case Number não numérico, todos vão como texto antes de juntar (senão o
+    categórico mistura inteiros e texto).
+    """
+    keys = [f["Case Number"] for f in frames if "Case Number" in f.columns]
+    if not all(pd.api.types.is_numeric_dtype(k) for k in keys):
+        frames = [f.assign(**{"Case Number": _case_number_text(f["Case Number"])}) if "Case Number" in f.columns else f
+                  for f in frames]
+    df = pd.concat([f.assign(_arquivo=i) for i, f in enumerate(frames)], ignore_index=True)
+    df.attrs = {}
+    if compact:
+        for cc in CATEGORY_COLS:
+            if cc in df.columns:
+                df[cc] = df[cc].astype("category")
+        if "Case Number" in df.columns:
+            df["Case Number"] = compact_case_number(df["Case Number"])
+    return df
+
+def merge_cases(frames: list, order_by: str = None, compact: bool = True) -> pd.DataFrame:
+    """
+    Junta exportações de Casos e deixa uma linha por Case Number: a de order_by (coluna de data) mais
+    recente; sem order_by, ou com data vazia/empatada, vale o arquivo mais ao fim da lista.
+    Linhas sem Case Number ficam todas. A ordem das linhas restantes é a da concatenação.
+    """
+    df = concat_exports(frames, compact)
+    if "Case Number" in df.columns:
+        by = ([order_by] if order_by in df.columns else []) + ["_arquivo"]
+        ordem = df.sort_values(by, kind="stable", na_position="first")
+        keep = ~ordem["Case Number"].astype(str).duplicated(keep="last") | ordem["Case Number"].isna()
+        df = ordem[keep.to_numpy()].sort_index()
+    return df.drop(columns="_arquivo").reset_index(drop=True)
+
+def merge_history(frames: list, compact: bool = True) -> pd.DataFrame:
+    """Junta Históricos de Estágios: para cada Case Number, ficam só as linhas do último arquivo que o traz."""
+    df = concat_exports(frames, compact)
+    if "Case Number" in df.columns:
+        keys = df["Case Number"].astype(str)
+        ultimo = df.groupby(keys, sort=False)["_arquivo"].transform("max")
+        df = df[(df["_arquivo"] == ultimo) | df["Case Number"].isna()]
+    return df.drop(columns="_arquivo").reset_index(drop=True)
+
+# =========================
+# ATUALIZAÇÃO INCREMENTAL (snapshot diário)
+# O último dataset normalizado fica em Parquet; a nova exportação é comparada por Case Number e
+# só as linhas novas/alteradas passam pelo enriquecimento. Ativos por área e dias por stage são
+# reagregados só nos grupos (Practice Area / Stage Clean) tocados pelas mudanças.
+# =========================
+SNAPSHOT_FILES = {"casos": "casos.parquet", "static": "casos_enriquecidos.parquet",
+                  "active_by_area": "ativos_por_area.parquet", "stage_day_stats": "dias_por_stage.parquet"}
+
+def _to_parquet(df: pd.DataFrame, path: Path):
+    """
+    Parquet do frame; colunas de texto com tipos misturados (ex.: número e texto), inclusive categóricos
+    com categorias misturadas, vão como string.
+    """
+    try:
+        df.to_parquet(path, index=False)
+    except (TypeError, ValueError):
+        mixed = {c: "string" for c in df.columns
+                 if df[c].dtype == object
+                 or (isinstance(df[c].dtype, pd.CategoricalDtype) and df[c].cat.categories.dtype == object)}
+        df.astype(mixed).to_parquet(path, index=False)
+
+def save_snapshot(snap_dir, df: pd.DataFrame, static: pd.DataFrame, tables: dict):
+    """Grava o dataset normalizado, o enriquecimento estático e as tabelas incrementais em snap_dir."""
+    snap_dir = Path(snap_dir)
+    snap_dir.mkdir(parents=True, exist_ok=True)
+    for name, frame in [("casos", df), ("static", static)] + list(tables.items()):
+        _to_parquet(frame, snap_dir / SNAPSHOT_FILES[name])
+
+def load_snapshot(snap_dir):
+    """(casos, static, {tabela: frame}) do último snapshot, ou None se não houver um completo."""
+    paths = {k: Path(snap_dir) / f for k, f in SNAPSHOT_FILES.items()}
+    if not all(p.exists() for p in paths.values()):
+        return None
+    frames = {k: pd.read_parquet(p) for k, p in paths.items()}
+    return frames.pop("casos"), frames.pop("static"), frames
+
+def _case_keys(*frames) -> list:
+    """Case Number de cada frame, comparáveis entre si: numéricos como estão, senão como texto."""
+    cols = [f["Case Number"] for f in frames]
+    if all(pd.api.types.is_numeric_dtype(c) for c in cols):
+        return cols
+    return [c.astype(str) for c in cols]
+
+def _match(ko: pd.Series, kn: pd.Series) -> np.ndarray:
+    """Para cada linha de kn, a posição da (última) linha de ko com o mesmo Case Number; -1 se não existe."""
+    last = np.flatnonzero(~ko.duplicated(keep="last").to_numpy())
+    hit = pd.Index(ko.to_numpy()[last]).get_indexer(kn.to_numpy())
+    return np.where(hit >= 0, last[hit], -1)
+
+def _same_values(a: pd.Series, b: pd.Series, pa: np.ndarray, pb: np.ndarray) -> np.ndarray:
+    """a[pa] == b[pb] posição a posição, com NaN == NaN (categóricos comparados pelos códigos)."""
+    if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+        cats = a.cat.categories.union(b.cat.categories)
+        return a.cat.set_categories(cats).cat.codes.to_numpy()[pa] == b.cat.set_categories(cats).cat.codes.to_numpy()[pb]
+    native = [pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_dtype(s) for s in (a, b)]
+    if a.dtype != b.dtype and not all(native):
+        a, b = a.astype(str), b.astype(str)   # o Parquet pode devolver texto onde havia tipos misturados
+        native = [False, False]
+    x, y = [s.to_numpy() if nat else s.to_numpy(dtype=object, na_value=None) for s, nat in zip((a, b), native)]
+    x, y = x[pa], y[pb]
+    return (x == y) | (pd.isna(x) & pd.isna(y))
+
+def diff_snapshots(old: pd.DataFrame, new: pd.DataFrame) -> dict:
+    """
+    Compara dois datasets por Case Number: novos, removidos e alterados (alguma coluna diferente; NaN == NaN).
+    Também devolve, por linha de new, "posicoes" (linha correspondente em old, −1 se não há) e "sujas"
+    (linhas novas, alteradas ou com Case Number repetido — as que precisam ser recalculadas), e em
+    "linhas_alteradas" as posições (em new) dos alterados.
+    """
+    ko, kn = _case_keys(old, new)
+    dup = kn.duplicated(keep=False).to_numpy()
+    pos = _match(ko, kn)
+    pn = np.flatnonzero(~dup & (pos >= 0))
+    changed = np.zeros(len(pn), dtype=bool)
+    for c in [c for c in new.columns if c in old.columns and c != "Case Number"]:
+        changed |= ~_same_values(old[c], new[c], pos[pn], pn)
+    sujas = dup | (pos < 0)
+    sujas[pn[changed]] = True
+    keys_n = kn.to_numpy()
+    return {"novos": pd.Index(keys_n[pos < 0]).unique(),
+            "removidos": pd.Index(ko[_match(kn, ko) < 0].unique()),
+            "alterados": pd.Index(keys_n[pn[changed]]),
+            "posicoes": pos, "sujas": sujas, "linhas_alteradas": pn[changed]}
+
+def stage_changes(old_static: pd.DataFrame, new_static: pd.DataFrame, pos: np.ndarray, rows: np.ndarray) -> pd.DataFrame:
+    """Linhas `rows` de new_static (com correspondente pos[rows] em old_static) cujo Stage Clean mudou."""
+    de = old_static["Stage Clean"].astype(str).to_numpy()[pos[rows]]
+    para = new_static["Stage Clean"].astype(str).to_numpy()[rows]
+    mud = de != para
+    return pd.DataFrame({"Case Number": new_static["Case Number"].to_numpy()[rows][mud], "De": de[mud], "Para": para[mud]})
+
+def refresh_static(old_static: pd.DataFrame, new_df: pd.DataFrame, pos: np.ndarray, sujas: np.ndarray) -> pd.DataFrame:
+    """
+    enrich_static(new_df) reaproveitando as linhas de old_static: só as linhas `sujas` são enriquecidas
+    de novo; as demais vêm de old_static.iloc[pos] (pos/sujas como em diff_snapshots).
+    """
+    fresh = enrich_static(new_df[sujas])
+    reused = old_static.iloc[pos[~sujas]].set_axis(new_df.index[~sujas])
+    out = pd.concat([reused, fresh]).loc[new_df.index]
+    for c in fresh.columns:
+        if pd.api.types.is_datetime64_dtype(fresh[c]):
+            out[c] = out[c].astype(fresh[c].dtype)   # Parquet devolve as datas em ms
+    for c in ["Practice Area", "Stage Clean"]:
+        if c in out.columns:
+            out[c] = out[c].astype(str)
+    return out
+
+# resumo -> (função, coluna de grupo, coluna de ordenação, colunas exigidas do frame enriquecido)
+INCREMENTAL_SUMMARIES = {
+    "active_by_area": (active_by_area, "Practice Area", "Casos Ativos", {"Practice Area", "Ativo"}),
+    "stage_day_stats": (stage_day_stats, "Stage Clean", "Média (dias)", {"Stage Clean", "Stage Days"}),
+}
+
+def refresh_summary(old_table: pd.DataFrame, static: pd.DataFrame, name: str, groups) -> pd.DataFrame:
+    """Resumo `name` (de INCREMENTAL_SUMMARIES) com só os grupos em `groups` recalculados."""
+    summarize, col, sort_by, _ = INCREMENTAL_SUMMARIES[name]
+    groups = set(groups)
+    part = summarize(static[static[col].astype(str).isin(groups)])
+    keep = old_table[~old_table[col].astype(str).isin(groups)]
+    return pd.concat([keep, part], ignore_index=True).sort_values(sort_by, ascending=False, kind="stable").reset_index(drop=True)
+
+def incremental_refresh(snap_dir, df: pd.DataFrame) -> dict:
+    """
+    Compara o dataset df com o snapshot em snap_dir, sem gravá-lo (isso é com save_snapshot, depois de
+    confirmado). Retorna {"static", "tabelas", "diff", "anterior"}: diff é o diff_snapshots mais
+    "mudancas_stage", ou None quando não havia snapshot compatível (mesmas colunas) e tudo foi calculado
+    do zero; anterior é quando o snapshot comparado foi gravado. snap_dir None: sem snapshot.
+    """
+    snap = load_snapshot(snap_dir) if snap_dir else None
+    if snap is None or list(snap[0].columns) != list(df.columns) or "Case Number" not in df.columns:
+        static = enrich_static(df)
+        tables = {name: fn(static) for name, (fn, _, _, req) in INCREMENTAL_SUMMARIES.items() if req <= set(static.columns)}
+        return {"static": static, "tabelas": tables, "diff": None, "anterior": None}
+
+    old, old_static, tables = snap
+    anterior = datetime.fromtimestamp((Path(snap_dir) / SNAPSHOT_FILES["casos"]).stat().st_mtime)
+    diff = diff_snapshots(old, df)
+    pos, sujas, alteradas = diff.pop("posicoes"), diff.pop("sujas"), diff.pop("linhas_alteradas")
+    static = refresh_static(old_static, df, pos, sujas)
+    diff["mudancas_stage"] = stage_changes(old_static, static, pos, alteradas)
+
+    # grupos afetados: os das linhas recalculadas (frame novo) e os das linhas antigas que não foram
+    # reaproveitadas (removidas, alteradas ou repetidas)
+    saiu = np.ones(len(old_static), dtype=bool)
+    saiu[pos[~sujas]] = False
+    for name, table in tables.items():
+        col = INCREMENTAL_SUMMARIES[name][1]
+        groups = set(old_static.loc[saiu, col].astype(str)) | set(static.loc[sujas, col].astype(str))
+        if groups:
+            tables[name] = refresh_summary(table, static, name, groups)
+    return {"static": static, "tabelas": tables, "diff": diff, "anterior": anterior}
@@ -0,0 +1,85 @@
+"""
+Instrumentação leve por seção: tempo de parede, linhas processadas e variação de memória (RSS).
+
+    log = []
+    with profile_section(log, "Estimativa", run=3) as sec:
+        resumo = ...
+        sec["linhas"] = len(df)
+
+Sem dependência do Streamlit: o app guarda o log em session_state e mostra no painel de debug.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+PROFILE_COLUMNS = ["rerun", "secao", "tempo_ms", "linhas", "mem_delta_mb", "rss_mb", "quando"]
+
+def rss_mb() -> float:
+    """
+    Memória residente atual do processo (MB). Fora do Linux, cai para o pico (ru_maxrss, em bytes no
+    macOS e KB nos demais); sem o módulo resource (Windows), NaN.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+@contextmanager
+def profile_section(log: list, name: str, rows=None, run=None, max_entries: int = 5000):
+    """Mede o bloco e acrescenta uma linha em log. O dict entregue aceita "linhas" definido dentro do bloco."""
+    info = {"linhas": rows}
+    m0 = rss_mb()
+    t0 = time.perf_counter()
+    try:
+        yield info
+    finally:
+        wall = time.perf_counter() - t0
+        m1 = rss_mb()
+        log.append({"rerun": run, "secao": name, "tempo_ms": round(wall * 1000, 1), "linhas": info["linhas"],
+                    "mem_delta_mb": round(m1 - m0, 2), "rss_mb": round(m1, 1),
+                    "quando": time.strftime("%Y-%m-%d %H:%M:%S")})
+        if len(log) > max_entries:
+            del log[: len(log) - max_entries]
+
+def profiled(get_log, name: str = None, get_run=lambda: None):
+    """Decorator: mede cada chamada de fn com profile_section(get_log(), name, run=get_run())."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile_section(get_log(), name or fn.__name__, run=get_run()):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def profile_frame(log: list) -> pd.DataFrame:
+    return pd.DataFrame(log, columns=PROFILE_COLUMNS)
+
+def profile_summary(log: list) -> pd.DataFrame:
+    """Agregado por seção ao longo da sessão: chamadas, média/p95/máx de tempo e média de memória."""
+    df = profile_frame(log)
+    if df.empty:
+        return df
+    g = df.groupby("secao", sort=False)
+    out = pd.DataFrame({
+        "chamadas": g["tempo_ms"].count(),
+        "media_ms": g["tempo_ms"].mean(),
+        "p95_ms": g["tempo_ms"].quantile(0.95),
+        "max_ms": g["tempo_ms"].max(),
+        "media_mem_delta_mb": g["mem_delta_mb"].mean(),
+    })
+    return out.round(1).sort_values("media_ms", ascending=False).reset_index()
+
+def profile_json(log: list) -> bytes:
+    return json.dumps(log, ensure_ascii=False, indent=2, default=str).encode("utf-8")
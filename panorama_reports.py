@@ -0,0 +1,154 @@
+"""
+Relatórios DOCX por cliente (um por Case Number), gerados em paralelo e gravados direto num ZIP.
+
+Os dados de cada caso são montados de uma vez no processo principal (payloads pequenos e picklable);
+os workers só renderizam o DOCX. No máximo ~workers*4 documentos ficam em memória ao mesmo tempo:
+cada um é escrito no ZIP assim que fica pronto.
+"""
+import io
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from docx import Document
+
+from panorama_core import (
+    enrich_cases, case_metrics_table, build_stage_index, stage_durations, fmt_date, as_date,
+)
+
+HIST_COLS = ["Case Number", "Case Stage", "Start Date", "End Date"]
+
+def sol_status(open_date, sol_date, dias_ate_sol) -> str:
+    """Mesmo texto do painel do cliente."""
+    if not (open_date and sol_date):
+        return "Datas insuficientes para avaliar SOL."
+    if dias_ate_sol < 0:
+        return "SOL ultrapassado."
+    if dias_ate_sol <= 5:
+        return "Menos de 5 dias para o SOL."
+    return "Dentro do prazo do SOL."
+
+def build_payloads(df_cases: pd.DataFrame, df_stages, hoje, case_numbers=None, enriched=None) -> list:
+    """
+    Um dict por caso com tudo o que o DOCX mostra (painel do cliente + histórico de estágios).
+    case_numbers filtra os casos; enriched reaproveita um enrich_cases(df_cases, hoje) já calculado.
+    """
+    e = enriched if enriched is not None else enrich_cases(df_cases, hoje)
+    df_cases = df_cases.loc[e.index]       # enriched pode ser um recorte (data de referência passada)
+    metrics = case_metrics_table(e, hoje)
+    cn = df_cases["Case Number"]
+    keys = cn.astype(str)
+    sel = cn.notna() & ~keys.duplicated()
+    if case_numbers is not None:
+        sel &= keys.isin({str(c) for c in case_numbers})
+
+    hist_by_case = {}
+    if df_stages is not None and all(c in df_stages.columns for c in HIST_COLS):
+        ordered, groups = build_stage_index(df_stages)
+        dias = stage_durations(ordered, hoje).to_numpy()
+        starts = pd.to_datetime(ordered["Start Date"], errors="coerce").dt.date.to_numpy()
+        ends = pd.to_datetime(ordered["End Date"], errors="coerce").dt.date.to_numpy()
+        stages = ordered["Case Stage"].astype(str).to_numpy()
+        wanted = set(keys[sel])
+        for k, pos in groups.items():
+            if k in wanted:
+                hist_by_case[k] = [(stages[i], fmt_date(starts[i]), "em aberto" if pd.isna(ends[i]) else fmt_date(ends[i]), int(dias[i]))
+                                   for i in pos]
+
+    def col(frame, c, default):
+        return frame[c].tolist() if c in frame.columns else [default] * len(frame)
+
+    nomes, areas = col(df_cases, "Case", ""), col(e, "Practice Area", "")
+    stage, sdays = col(e, "Stage Clean", ""), col(e, "Stage Days", 0)
+    opens, sols = col(e, "Open Date", None), col(e, "Statute of Limitations Date", None)
+    m_cols = {c: metrics[c].tolist() for c in ["tempo_processo","dias_desde_open","dias_ate_sol","progresso_sol"]}
+
+    payloads = []
+    for i in sel.to_numpy().nonzero()[0]:
+        k = keys.iat[i]
+        od, sol = as_date(opens[i]), as_date(sols[i])
+        m = {c: v[i] for c, v in m_cols.items()}
+        payloads.append({
+            "case_number": k,
+            "nome": "" if pd.isna(nomes[i]) else str(nomes[i]), "area": str(areas[i]),
+            "stage": str(stage[i]), "stage_days": int(sdays[i]),
+            "open_date": fmt_date(od), "sol_date": fmt_date(sol),
+            "tempo_processo": int(m["tempo_processo"]), "dias_desde_open": int(m["dias_desde_open"]),
+            "dias_ate_sol": max(int(m["dias_ate_sol"]), 0), "progresso_sol": float(m["progresso_sol"]),
+            "sol_status": sol_status(od, sol, int(m["dias_ate_sol"])),
+            "historico": hist_by_case.get(k, []),
+            "hoje": fmt_date(hoje),
+        })
+    return payloads
+
+def render_case_docx(p: dict) -> tuple:
+    """Renderiza um payload. Retorna (nome do arquivo no ZIP, bytes do DOCX)."""
+    doc = Document()
+    doc.add_heading(f"Relatório do Caso — {p['nome'] or '—'}", level=1)
+    doc.add_paragraph(f"Case Number: {p['case_number']}\nPractice Area: {p['area'] or '—'}\n"
+                      f"Stage atual: {p['stage'] or '—'} (dias no stage via '()': {p['stage_days']})\n"
+                      f"Open Date: {p['open_date']}    SOL: {p['sol_date']}\nData de referência: {p['hoje']}")
+
+    doc.add_heading("Tempo do processo e SOL", level=2)
+    t = doc.add_table(rows=0, cols=2)
+    for label, val in [("Tempo do processo (dias)", p["tempo_processo"]), ("Dias desde Open Date", p["dias_desde_open"]),
+                       ("Dias até SOL", p["dias_ate_sol"]), ("Progresso do SOL", f"{p['progresso_sol']:.2f}%")]:
+        row = t.add_row().cells
+        row[0].text, row[1].text = label, str(val)
+    doc.add_paragraph(p["sol_status"])
+
+    doc.add_heading("Duração por Case Stage", level=2)
+    if p["historico"]:
+        h = doc.add_table(rows=1, cols=4)
+        for cell, txt in zip(h.rows[0].cells, ["Stage", "Início", "Fim", "Dias"]):
+            cell.text = txt
+        for stage, ini, fim, dias in p["historico"]:
+            row = h.add_row().cells
+            row[0].text, row[1].text, row[2].text, row[3].text = stage, ini, fim, str(dias)
+    else:
+        doc.add_paragraph("Sem histórico de estágios para este caso.")
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in p["case_number"])
+    return f"caso_{safe}.docx", buf.getvalue()
+
+def iter_case_reports(payloads: list, workers=None, in_flight: int = None):
+    """Gera (nome, bytes) em paralelo, na ordem dos payloads, com no máximo in_flight documentos pendentes."""
+    workers = workers or os.cpu_count() or 1
+    limit = in_flight or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for p in payloads:
+            pending.append(pool.submit(render_case_docx, p))
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _unique_name(name: str, used: set) -> str:
+    """name, ou name com sufixo _2, _3… se já foi usado (comparação sem caixa, como no Windows/macOS)."""
+    stem, ext = os.path.splitext(name)
+    k = 1
+    while name.lower() in used:
+        k += 1
+        name = f"{stem}_{k}{ext}"
+    used.add(name.lower())
+    return name
+
+def write_reports_zip(payloads: list, out, workers=None, on_progress=None) -> int:
+    """
+    Escreve um DOCX por payload no ZIP `out` (caminho ou arquivo binário). Retorna quantos foram gravados.
+    Case Numbers que viram o mesmo nome de arquivo (ex.: "A/1" e "A_1") ganham sufixo, sem sobrescrever.
+    """
+    n = 0
+    used = set()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in iter_case_reports(payloads, workers):
+            zf.writestr(_unique_name(name, used), data)
+            n += 1
+            if on_progress:
+                on_progress(n, len(payloads))
+    return n
@@ -0,0 +1,58 @@
+import io
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+st = pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+APP = Path(__file__).resolve().parents[1] / "app.py"
+
+
+class Upload(io.BytesIO):
+    """Arquivo enviado, como o UploadedFile do Streamlit (name, file_id, size, getvalue)."""
+    def __init__(self, path):
+        super().__init__(path.read_bytes())
+        self.name, self.file_id, self.size = path.name, str(path), len(self.getvalue())
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """Dict key do file_uploader -> lista de caminhos; o widget é desenhado, mas devolve estes arquivos."""
+    files = {}
+    orig = st.file_uploader
+
+    def fake(label, *a, key=None, accept_multiple_files=False, **k):
+        orig(label, *a, key=key, accept_multiple_files=accept_multiple_files, **k)
+        ups = [Upload(p) for p in files.get(key, [])]
+        return ups if accept_multiple_files else (ups[0] if ups else None)
+
+    monkeypatch.setattr(st, "file_uploader", fake)
+    st.cache_resource.clear()
+    yield files
+    st.cache_resource.clear()
+
+
+def export(path, n, first):
+    pd.DataFrame({
+        "Caso": [f"Cliente {i}" for i in range(n)],
+        "Case Number": range(first, first + n),
+        "Área": "AOS",
+        "Status": "Intake (3 days)",
+        "Open Date": "01/01/2024",
+    }).to_csv(path, index=False)
+    return path
+
+
+def test_remap_with_small_ingest_cache(uploads, monkeypatch, tmp_path):
+    # cache pequeno: ler a coluna nova de um arquivo tira do cache o frame normalizado do outro
+    monkeypatch.setenv("PANORAMA_CACHE_MB", "0.3")
+    uploads["up_cases"] = [export(tmp_path / "a.csv", 3000, 0), export(tmp_path / "b.csv", 3600, 10_000)]
+    at = AppTest.from_file(str(APP), default_timeout=120).run()
+    key = "map_Casos — 2. b.csv_Case"
+    for value in ["(não usar)", "Caso"]:
+        at.selectbox(key=key).set_value(value).run()
+        assert not at.exception
+        assert not [e.value for e in at.error if "Erro ao ler" in e.value]
+    assert len(at.session_state["df_cases"]) == 6600
@@ -0,0 +1,66 @@
+from datetime import datetime, date
+
+import pandas as pd
+import pytest
+
+from panorama_core import infer_date_format, parse_date_column, normalize_mapped
+
+
+def dates(d):
+    return [None if pd.isna(x) else x.date() for x in d]
+
+
+@pytest.mark.parametrize("values, fmt", [
+    (["15/01/2024", "31/12/2023"], "%d/%m/%Y"),
+    (["2024-01-15", "2023-12-31"], "%Y-%m-%d"),
+    (["20240115", "20231231"], "%Y%m%d"),
+    ([20240115, 20231231], "%Y%m%d"),
+    (["45306", "45291"], "excel"),
+    ([45306.0, 45291.5], "excel"),
+])
+def test_infer_date_format(values, fmt):
+    assert infer_date_format(pd.Series(values)) == fmt
+
+
+def test_dd_mm_is_day_first():
+    d, fmt, failed, _ = parse_date_column(pd.Series(["05/01/2024", "31/12/2023", None, ""]))
+    assert fmt == "%d/%m/%Y"
+    assert dates(d) == [date(2024, 1, 5), date(2023, 12, 31), None, None]
+    assert len(failed) == 0
+
+
+@pytest.mark.parametrize("values", [["20240115", "20231231"], [20240115, 20231231], [20240115.0, 20231231.0]])
+def test_yyyymmdd_is_not_an_excel_serial(values):
+    d, fmt, failed, _ = parse_date_column(pd.Series(values))
+    assert fmt == "%Y%m%d"
+    assert dates(d) == [date(2024, 1, 15), date(2023, 12, 31)]
+    assert len(failed) == 0
+
+
+def test_excel_serials():
+    d, fmt, failed, _ = parse_date_column(pd.Series(["45306", "45291"]))
+    assert fmt == "excel"
+    assert dates(d) == [date(2024, 1, 15), date(2023, 12, 31)]
+
+
+def test_out_of_range_serials_are_failures():
+    d, fmt, failed, _ = parse_date_column(pd.Series(["45306", "99999999", "123456789"]))
+    assert fmt == "excel"
+    assert dates(d) == [date(2024, 1, 15), None, None]
+    assert failed.tolist() == [1, 2]
+
+
+def test_text_typed_in_excel_date_column_is_day_first():
+    col = pd.Series([datetime(2024, 1, i) for i in range(1, 21)] + ["05/01/2024", None, "lixo"], dtype=object)
+    d, fmt, failed, generic = parse_date_column(col)
+    assert d.iloc[20].date() == date(2024, 1, 5)
+    assert failed.tolist() == [22]
+    assert generic == 1
+
+
+def test_date_report():
+    df = normalize_mapped(pd.DataFrame({"Open Date": ["45306", "99999999"], "Closed Date": ["15/01/2024", "x"]}), {})
+    rep = df.attrs["date_report"]
+    assert rep["Open Date"]["falhas"] == 1 and rep["Open Date"]["linhas"] == [1]
+    assert rep["Closed Date"]["falhas"] == 1
+    assert df["Open Date"].iloc[0] == pd.Timestamp(2024, 1, 15)
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from panorama_core import compact_case_number, normalize_mapped, merge_cases, merge_history
+
+
+def cases(numbers, closed=None, stage="Intake"):
+    df = pd.DataFrame({"Case Number": numbers, "Case Stage": stage, "Open Date": "01/01/2024"})
+    if closed is not None:
+        df["Closed Date"] = closed
+    return normalize_mapped(df, {})
+
+
+def test_compact_case_number():
+    assert compact_case_number(pd.Series(["10", "2", None])).dtype == "Int64"
+    assert compact_case_number(pd.Series([10, 2])).dtype.kind == "i"
+    zeros = compact_case_number(pd.Series(["007", "8"]))
+    assert isinstance(zeros.dtype, pd.CategoricalDtype) and zeros.tolist() == ["007", "8"]
+
+
+def test_merge_keeps_last_file():
+    a = cases(["1", "2"], stage="A")
+    b = cases(["2", "3"], stage="B")
+    m = merge_cases([a, b])
+    assert m["Case Number"].tolist() == [1, 2, 3]
+    assert m["Case Stage"].astype(str).tolist() == ["A", "B", "B"]
+
+
+def test_merge_by_most_recent_date():
+    a = cases(["1"], closed=["10/01/2024"], stage="A")
+    b = cases(["1"], closed=["05/01/2024"], stage="B")
+    assert merge_cases([a, b], order_by="Closed Date")["Case Stage"].astype(str).tolist() == ["A"]
+
+
+def test_merge_numeric_and_text_ids():
+    a = cases([7, 8, None])
+    b = cases(["X-1", "007", "8"])
+    for compact in (True, False):
+        m = merge_cases([a, b], compact=compact)
+        keys = [None if pd.isna(k) else k for k in m["Case Number"].tolist()]
+        assert keys == ["7", None, "X-1", "007", "8"]      # o "8" do segundo arquivo substitui o 8
+        if compact:
+            assert m["Case Number"].cat.categories.map(type).unique().tolist() == [str]
+
+
+def test_merge_history_keeps_last_file_per_case():
+    a = normalize_mapped(pd.DataFrame({"Case Number": ["1", "1", "2"], "Case Stage": ["A", "B", "A"]}), {})
+    b = normalize_mapped(pd.DataFrame({"Case Number": ["1"], "Case Stage": ["C"]}), {})
+    m = merge_history([a, b])
+    assert list(zip(m["Case Number"], m["Case Stage"].astype(str))) == [(2, "A"), (1, "C")]
@@ -0,0 +1,54 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from panorama_core import (
+    normalize_mapped, enrich_static, enrich_cases, backlog_series, build_sol_index, sol_due_within, sol_overrun,
+    infer_sol, completion_summary,
+)
+
+HOJE = date(2024, 3, 1)
+
+
+def cases(rows):
+    df = pd.DataFrame(rows, columns=["Case Number", "Practice Area", "Case Stage", "Open Date", "Closed Date",
+                                     "Statute of Limitations Date"])
+    return normalize_mapped(df, {})
+
+
+def test_backlog_series():
+    static = enrich_static(cases([
+        ("1", "AOS", "Intake", "01/01/2024", "03/01/2024", ""),
+        ("2", "AOS", "Intake", "02/01/2024", "", ""),
+        ("3", "K1", "Intake", "02/01/2024", "01/01/2024", ""),     # fechado antes de abrir: fora
+    ]))
+    s = backlog_series(static, end=date(2024, 1, 4))
+    assert s["AOS"].tolist() == [1, 2, 1, 1]
+    assert "K1" not in s.columns
+    assert s.index[-1] == pd.Timestamp(2024, 1, 4)
+
+
+def test_sol_queries():
+    e = enrich_cases(cases([
+        ("1", "AOS", "Intake", "01/01/2024", "", "05/03/2024"),
+        ("2", "AOS", "Intake", "01/01/2024", "", "20/02/2024"),
+        ("3", "AOS", "Approved", "01/01/2024", "", "02/03/2024"),   # encerrado: fora
+        ("4", "K1", "Intake", "15/02/2024", "", ""),               # inferida: +30 dias
+    ]), HOJE)
+    sol, inferred = infer_sol(e)
+    assert inferred.tolist() == [False, False, False, True]
+    assert sol[3] == np.datetime64("2024-03-16")
+    idx = build_sol_index(e)
+    assert sol_due_within(idx, HOJE, 7).tolist() == [0]
+    assert sol_due_within(idx, HOJE, 30).tolist() == [0, 3]
+    assert sol_overrun(idx, HOJE).tolist() == [1]
+
+
+def test_completion_pending_decision_discounts_stage_days():
+    e = enrich_cases(cases([
+        ("1", "AOS", "USCIS Pending Decision (10 days)", "01/02/2024", "", ""),
+        ("2", "AOS", "Intake", "01/02/2024", "", ""),
+    ]), HOJE)
+    assert e["AdjCompletionDays"].tolist() == [19, 29]
+    assert completion_summary(e)["media_tempo_conclusao"].tolist() == [24.0]
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from panorama_core import (
+    normalize_mapped, enrich_static, diff_snapshots, incremental_refresh, save_snapshot, load_snapshot,
+    INCREMENTAL_SUMMARIES, _to_parquet,
+)
+
+
+def cases(rows):
+    df = pd.DataFrame(rows, columns=["Case Number", "Practice Area", "Case Stage", "Open Date"])
+    return normalize_mapped(df, {})
+
+
+OLD = [("1", "AOS", "Intake (3 days)", "01/01/2024"),
+       ("2", "AOS", "Drafting", "02/01/2024"),
+       ("3", "EB1", "Approved", "03/01/2024")]
+NEW = [("1", "AOS", "Intake (3 days)", "01/01/2024"),
+       ("2", "AOS", "Approved", "02/01/2024"),
+       ("4", "K1", "Intake", "04/01/2024")]
+
+
+def test_diff_snapshots():
+    d = diff_snapshots(cases(OLD), cases(NEW))
+    assert d["novos"].tolist() == [4]
+    assert d["removidos"].tolist() == [3]
+    assert d["alterados"].tolist() == [2]
+    assert d["posicoes"].tolist() == [0, 1, -1]
+    assert d["sujas"].tolist() == [False, True, True]
+
+
+def test_incremental_refresh_matches_full_enrichment(tmp_path):
+    old, new = cases(OLD), cases(NEW)
+    first = incremental_refresh(tmp_path, old)
+    assert first["diff"] is None
+    assert load_snapshot(tmp_path) is None           # só grava quando confirmado
+    save_snapshot(tmp_path, old, first["static"], first["tabelas"])
+
+    inc = incremental_refresh(tmp_path, new)
+    assert inc["diff"]["mudancas_stage"][["De", "Para"]].values.tolist() == [["Drafting", "Approved"]]
+    full = enrich_static(new)
+    for name, (fn, col, _, _) in INCREMENTAL_SUMMARIES.items():
+        got = inc["tabelas"][name].set_index(col).sort_index()
+        want = fn(full).set_index(col).sort_index()
+        got.index, want.index = got.index.astype(str), want.index.astype(str)
+        pd.testing.assert_frame_equal(got, want, check_dtype=False)
+    for c in full.columns:
+        pd.testing.assert_series_equal(inc["static"][c], full[c], check_dtype=False, check_categorical=False)
+
+
+def test_without_snapshot_dir():
+    assert incremental_refresh(None, cases(OLD))["diff"] is None
+
+
+def test_parquet_with_mixed_categories(tmp_path):
+    df = pd.DataFrame({"Case Number": pd.Categorical.from_codes([0, 1], pd.Index([1, "A-2"], dtype=object))})
+    _to_parquet(df, tmp_path / "x.parquet")
+    back = pd.read_parquet(tmp_path / "x.parquet")
+    assert back["Case Number"].tolist() == ["1", "A-2"]
+    assert len(diff_snapshots(back, df)["alterados"]) == 0
@@ -0,0 +1,71 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from panorama_core import (
+    extract_stage_label_and_days, parse_stage_series, parse_stage_unique, stage_intervals,
+    stage_transitions, measured_stage_stats, history_as_of,
+)
+
+STAGES = ["USCIS Pending Decision (23 days)", "Case denied (68 days)", "RFE Draft (14)", "Stage (A) (7 days)",
+          "Approved (3 dias)", "Intake", "Closed ()", "", None, 5]
+
+
+def test_extract_stage_label_and_days():
+    assert extract_stage_label_and_days("USCIS Pending Decision (23 days)") == ("USCIS Pending Decision", 23)
+    assert extract_stage_label_and_days("Stage (A) (7 days)") == ("Stage", 7)
+    assert extract_stage_label_and_days(None) == ("", 0)
+
+
+def test_parse_stage_series_matches_row_version():
+    s = pd.Series(STAGES, dtype=object)
+    parsed = parse_stage_series(s)
+    expected = [extract_stage_label_and_days(v) for v in STAGES]
+    assert list(zip(parsed["Stage Clean"], parsed["Stage Days"])) == expected
+
+
+def test_parse_stage_unique_matches_series():
+    s = pd.Series(STAGES * 3, dtype=object)
+    pd.testing.assert_frame_equal(parse_stage_unique(s), parse_stage_series(s))
+
+
+def history(rows):
+    return pd.DataFrame(rows, columns=["Case Number", "Case Stage", "Start Date", "End Date"]).astype(
+        {"Start Date": "datetime64[s]", "End Date": "datetime64[s]"})
+
+
+def test_stage_intervals_transitions():
+    h = history([
+        (1, "A (2 days)", "2024-01-01", "2024-01-11"),
+        (1, "B", "2024-01-11", None),
+        (2, "A", "2024-01-05", "2024-01-06"),
+        (2, "C", "2024-01-06", "2024-01-26"),
+    ])
+    iv = stage_intervals(h, date(2024, 2, 1))
+    assert iv["Próximo Stage"].tolist()[:2] == ["B", "C"]
+    t = stage_transitions(iv).set_index(["Stage", "Próximo Stage"])
+    assert t.loc[("A", "B"), "Média (dias)"] == 10
+    assert t.loc[("A", "C"), "#Intervalos"] == 1
+    stats = measured_stage_stats(iv).set_index("Stage")
+    assert set(stats.index) == {"A", "C"}          # B ainda está em aberto
+
+
+def test_undated_rows_do_not_create_transitions():
+    h = history([
+        (1, "A", "2024-01-01", "2024-02-01"),
+        (1, "C", None, None),
+        (1, "B", "2024-02-01", None),
+    ])
+    iv = stage_intervals(h, date(2024, 3, 1))
+    pares = set(map(tuple, iv.dropna(subset=["Próximo Stage"])[["Stage", "Próximo Stage"]].to_numpy()))
+    assert pares == {("A", "B")}
+
+
+def test_history_as_of():
+    h = history([
+        (1, "A", "2024-01-01", "2024-02-01"),
+        (1, "B", "2024-02-01", None),
+    ])
+    past = history_as_of(h, date(2024, 1, 15))
+    assert len(past) == 1 and np.isnat(past["End Date"].to_numpy()).all()
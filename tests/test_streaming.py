@@ -0,0 +1,40 @@
+import io
+
+import pandas as pd
+import pytest
+
+from panorama_core import read_header, read_table_streaming
+
+CSV = b"Case Number,Z,Open Date\n" + b"".join(b"%d,00%d,01/01/2024\n" % (i, i) for i in range(10)) + b"X-1,abc,\n"
+
+
+def test_csv_reads_text_in_chunks():
+    seen = []
+    df = read_table_streaming(io.BytesIO(CSV), "a.csv", usecols=["Z", "Case Number"], chunk_rows=3,
+                              on_progress=lambda rows, frac: seen.append(rows))
+    assert list(df.columns) == ["Case Number", "Z"]
+    assert df["Z"].iloc[0] == "000"              # zeros à esquerda preservados
+    assert df["Case Number"].tolist()[-2:] == ["9", "X-1"]
+    assert seen == [3, 6, 9, 11]
+
+
+def test_header_rewinds_buffer():
+    buf = io.BytesIO(CSV)
+    assert read_header(buf, "a.csv") == ["Case Number", "Z", "Open Date"]
+    assert len(read_table_streaming(buf, "a.csv")) == 11
+
+
+def test_limits():
+    with pytest.raises(ValueError, match="linhas"):
+        read_table_streaming(io.BytesIO(CSV), "a.csv", chunk_rows=3, max_rows=5)
+    with pytest.raises(ValueError, match="MB"):
+        read_table_streaming(io.BytesIO(CSV), "a.csv", chunk_rows=3, max_mb=1e-6)
+
+
+def test_xlsx_mixed_column_becomes_text(tmp_path):
+    pytest.importorskip("openpyxl")
+    path = tmp_path / "a.xlsx"
+    pd.DataFrame({"Case Number": [1, 2, "X-3"], "Vazio": [None, None, None]}).to_excel(path, index=False)
+    df = read_table_streaming(path, chunk_rows=2)
+    assert df["Case Number"].tolist() == ["1", "2", "X-3"]
+    assert df["Vazio"].isna().all()